@@ -1,50 +1,101 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file
+from flask import (Flask, render_template, request, redirect, url_for, flash, send_file, after_this_request,
+                   Response, stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import bindparam, case, event, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.hybrid import hybrid_property, Comparator
+from sqlalchemy.engine import Engine
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 import pandas as pd
 import os
+import csv
+import hashlib
 import io
+import itertools
+import json
+import sqlite3
+import time
+import uuid
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from urllib.parse import quote
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from reportlab.lib.utils import ImageReader
 import numpy as np
-from io import BytesIO
 import base64
+import click
 
-try:
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-
-    arial_path = "C:/Windows/Fonts/arial.ttf"
-    if os.path.exists(arial_path):
-        pdfmetrics.registerFont(TTFont('RussianArial', arial_path))
-        print("Русский шрифт зарегистрирован как: RussianArial")
-
-        registered_fonts = pdfmetrics.getRegisteredFontNames()
-        print(f"Доступные шрифты: {registered_fonts}")
-
-except Exception as e:
-    print(f"Не удалось зарегистрировать русский шрифт: {e}")
+import cache
+import charts
+import enrollment
+import ingest
+import migrations
+import report_resources
+import simulation
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here-change-this-in-production'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///admission.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+app.config['SQLITE_CACHE_SIZE'] = -64000
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['SQLITE_BUSY_TIMEOUT'] = 5000
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['CAMPAIGN_YEAR'] = datetime.now().year
+app.config['UPLOAD_WORKERS'] = min(4, os.cpu_count() or 1)
+app.config['UPLOAD_CHUNK_ROWS'] = 50000
+app.config['ARCHIVE_UPLOADS'] = False
+app.config['UPLOAD_SPOOL_SIZE'] = 8 * 1024 * 1024
+app.config['RESULT_CACHE_SIZE'] = 256
+app.config['CASCADE_PAGE_SIZE'] = 50
+app.config['LIST_PAGE_SIZE'] = 100
+app.config['LIST_MAX_PAGE_SIZE'] = 1000
+app.config['CASCADE_MAX_PAGE_SIZE'] = 1000
+app.config['REPORT_FOLDER'] = 'reports'
+app.config['REPORT_WORKERS'] = 2
+app.config['REPORT_QUEUE_LIMIT'] = 10
+app.config['REPORT_CACHE_BYTES'] = 200 * 1024 * 1024
+app.config['CHART_WORKERS'] = min(4, os.cpu_count() or 1)
+app.config['SIMULATION_TRIALS'] = 2000
+app.config['SIMULATION_WORKERS'] = os.cpu_count() or 1
+app.config['SIMULATION_HORIZON_DAYS'] = 1
 
 db = SQLAlchemy(app)
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode = {app.config['SQLITE_JOURNAL_MODE']}")
+    cursor.execute(f"PRAGMA synchronous = {app.config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA cache_size = {int(app.config['SQLITE_CACHE_SIZE'])}")
+    cursor.execute(f"PRAGMA mmap_size = {int(app.config['SQLITE_MMAP_SIZE'])}")
+    cursor.execute(f"PRAGMA busy_timeout = {int(app.config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.close()
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs('reports', exist_ok=True)
+os.makedirs(app.config['REPORT_FOLDER'], exist_ok=True)
+
+archive_executor = ThreadPoolExecutor(max_workers=1)
+report_executor = ThreadPoolExecutor(max_workers=app.config['REPORT_WORKERS'])
+
+PROGRAM_SEATS = {'ПМ': 40, 'ИВТ': 50, 'ИТСС': 30, 'ИБ': 20}
+PROGRAMS = list(PROGRAM_SEATS)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -60,23 +111,410 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+class Program(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(20), unique=True, nullable=False)
+    seats = db.Column(db.Integer, default=0)
+
+    _names = {}
+
+    @classmethod
+    def name_of(cls, program_id):
+        if program_id not in cls._names:
+            cls._names = dict(db.session.query(cls.id, cls.name).all())
+        return cls._names.get(program_id)
+
+    def __repr__(self):
+        return f'<Program {self.name} ({self.seats})>'
+
+
+class CampaignDay(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, unique=True, nullable=False)
+    label = db.Column(db.String(5), unique=True, nullable=False)
+
+    _labels = {}
+
+    @classmethod
+    def label_of(cls, day_id):
+        if day_id not in cls._labels:
+            cls._labels = dict(db.session.query(cls.id, cls.label).all())
+        return cls._labels.get(day_id)
+
+    def __repr__(self):
+        return f'<CampaignDay {self.label}>'
+
+
+class Person(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+
+class LookupComparator(Comparator):
+    def __init__(self, column, key_column, value_column):
+        self.column = column
+        self.key_column = key_column
+        self.value_column = value_column
+        super().__init__(select(value_column).where(key_column == column).scalar_subquery())
+
+    def _code(self, value):
+        return select(self.key_column).where(self.value_column == value).scalar_subquery()
+
+    def __eq__(self, other):
+        return self.column == self._code(other)
+
+    def __ne__(self, other):
+        return self.column != self._code(other)
+
+    def in_(self, values):
+        return self.column.in_(select(self.key_column).where(self.value_column.in_(values)))
+
+
 class Applicant(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    applicant_id = db.Column(db.Integer)
+    applicant_id = db.Column(db.Integer, db.ForeignKey('person.id'))
+    program_id = db.Column(db.SmallInteger, db.ForeignKey('program.id'))
+    day_id = db.Column(db.SmallInteger, db.ForeignKey('campaign_day.id'))
     consent = db.Column(db.Boolean)
-    priority = db.Column(db.Integer)
-    physics = db.Column(db.Integer)
-    russian = db.Column(db.Integer)
-    math = db.Column(db.Integer)
-    achievements = db.Column(db.Integer)
-    total = db.Column(db.Integer)
-    program = db.Column(db.String(20))
-    date = db.Column(db.String(20))
+    priority = db.Column(db.SmallInteger)
+    physics = db.Column(db.SmallInteger)
+    russian = db.Column(db.SmallInteger)
+    math = db.Column(db.SmallInteger)
+    achievements = db.Column(db.SmallInteger)
+    total = db.Column(db.SmallInteger)
+    enrolled = db.Column(db.Boolean, default=False)
+    list_rank = db.Column(db.Integer)
+    consent_rank = db.Column(db.Integer)
+
+    @hybrid_property
+    def program(self):
+        return Program.name_of(self.program_id)
+
+    @program.comparator
+    def program(cls):
+        return LookupComparator(cls.program_id, Program.id, Program.name)
+
+    @hybrid_property
+    def date(self):
+        return CampaignDay.label_of(self.day_id)
+
+    @date.comparator
+    def date(cls):
+        return LookupComparator(cls.day_id, CampaignDay.id, CampaignDay.label)
 
     def __repr__(self):
         return f'<Applicant {self.applicant_id} - {self.program}>'
 
 
+db.Index('ix_applicant_day_program_consent_total',
+         Applicant.day_id, Applicant.program_id, Applicant.consent, Applicant.total.desc())
+db.Index('ix_applicant_program_consent_total',
+         Applicant.program_id, Applicant.consent, Applicant.total.desc())
+db.Index('ix_applicant_applicant_id_day', Applicant.applicant_id, Applicant.day_id)
+db.Index('ix_applicant_total_id', Applicant.total.desc(), Applicant.id.desc())
+db.Index('ix_applicant_day_program_total_id',
+         Applicant.day_id, Applicant.program_id, Applicant.total.desc(), Applicant.id.desc())
+db.Index('ix_applicant_priority_id', Applicant.priority.desc(), Applicant.id.desc())
+db.Index('ix_applicant_day_program_priority_id',
+         Applicant.day_id, Applicant.program_id, Applicant.priority.desc(), Applicant.id.desc())
+db.Index('ix_applicant_day_program_applicant_id',
+         Applicant.day_id, Applicant.program_id, Applicant.applicant_id.desc(), Applicant.id.desc())
+
+
+class ProgramDayStats(db.Model):
+    program_id = db.Column(db.Integer, db.ForeignKey('program.id'), primary_key=True)
+    day_id = db.Column(db.Integer, db.ForeignKey('campaign_day.id'), primary_key=True)
+    total = db.Column(db.Integer, default=0)
+    consent = db.Column(db.Integer, default=0)
+    min_total = db.Column(db.Integer)
+    max_total = db.Column(db.Integer)
+    avg_total = db.Column(db.Float)
+    enrolled = db.Column(db.Integer, default=0)
+    passing_score = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f'<ProgramDayStats {self.program_id}/{self.day_id}: {self.total}>'
+
+
+def refresh_program_day_stats(day_id, program_ids):
+    program_ids = list(program_ids)
+    if not program_ids:
+        return
+
+    ProgramDayStats.query.filter(
+        ProgramDayStats.day_id == day_id,
+        ProgramDayStats.program_id.in_(program_ids)
+    ).delete(synchronize_session=False)
+
+    aggregate = (
+        select(
+            Applicant.program_id,
+            Applicant.day_id,
+            func.count(),
+            func.sum(case((Applicant.consent, 1), else_=0)),
+            func.min(Applicant.total),
+            func.max(Applicant.total),
+            func.avg(Applicant.total)
+        )
+        .where(Applicant.day_id == day_id, Applicant.program_id.in_(program_ids))
+        .group_by(Applicant.program_id, Applicant.day_id)
+    )
+    db.session.execute(
+        ProgramDayStats.__table__.insert().from_select(
+            ['program_id', 'day_id', 'total', 'consent', 'min_total', 'max_total', 'avg_total'],
+            aggregate
+        )
+    )
+
+
+def campaign_dates():
+    has_data = db.session.query(Applicant.id).filter(Applicant.day_id == CampaignDay.id).exists()
+    return [d.label for d in CampaignDay.query.filter(has_data).order_by(CampaignDay.day).all()]
+
+
+def loaded_programs():
+    has_data = db.session.query(Applicant.id).filter(Applicant.program_id == Program.id).exists()
+    return [p.name for p in Program.query.filter(has_data).order_by(Program.id).all()]
+
+
+def program_seats():
+    seats = dict(db.session.query(Program.name, Program.seats).filter(Program.name.in_(PROGRAMS)).all())
+    return {name: seats.get(name, 0) for name in PROGRAMS}
+
+
+def day_id_of(label):
+    if label is None:
+        return None
+    return db.session.query(CampaignDay.id).filter_by(label=label).scalar()
+
+
+DayEnrollment = namedtuple('DayEnrollment', [
+    'ids', 'applicant_ids', 'program_ids', 'priorities', 'scores', 'accepted', 'enrolled', 'passing'
+])
+
+
+def seat_array():
+    seat_rows = db.session.query(Program.id, Program.seats).all()
+    seats = np.zeros(max([pid for pid, _ in seat_rows], default=0) + 1, dtype=np.int64)
+    for pid, count in seat_rows:
+        seats[pid] = count or 0
+    return seats
+
+
+# np.array по списку Row очень медленный: numpy пробует читать каждую строку как
+# отображение. Значения выкладываются подряд через fromiter и сворачиваются в таблицу.
+def int_rows(query, width):
+    rows = query.all()
+    flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width)
+    return flat.reshape(-1, width)
+
+
+def consenting_applications(day_id):
+    rows = int_rows(
+        db.session.query(Applicant.id, Applicant.applicant_id, Applicant.program_id,
+                         Applicant.priority, Applicant.total, func.coalesce(Applicant.enrolled, False))
+        .filter(Applicant.day_id == day_id, Applicant.consent == True),  # noqa: E712
+        6
+    )
+    return rows[:, :5], rows[:, 5].astype(bool)
+
+
+# Полный пересчет (~50 мс на 100 тыс. заявлений): даже одно изменение может сдвинуть
+# зачисление по всей цепочке приоритетов, а безопасный reenroll почти всегда сводится к нему же
+def update_enrollment(day_id):
+    data, previous = consenting_applications(day_id)
+    seats = seat_array()
+
+    accepted = enrollment.enroll(data[:, 1], data[:, 2], data[:, 3], data[:, 4], seats)
+
+    table = Applicant.__table__
+    flips = np.flatnonzero(accepted != previous)
+    if len(flips):
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(enrolled=bindparam('value')),
+            [{'row_id': int(data[i, 0]), 'value': bool(accepted[i])} for i in flips]
+        )
+    db.session.execute(
+        table.update()
+        .where(table.c.day_id == day_id, table.c.consent == False, table.c.enrolled == True)  # noqa: E712
+        .values(enrolled=False)
+    )
+
+    enrolled, passing = enrollment.summarize(accepted, data[:, 2], data[:, 4], seats)
+    stats_table = ProgramDayStats.__table__
+    db.session.execute(
+        stats_table.update()
+        .where(stats_table.c.day_id == day_id, stats_table.c.program_id == bindparam('pid'))
+        .values(enrolled=bindparam('count'), passing_score=bindparam('score')),
+        [{'pid': pid, 'count': int(enrolled[pid]), 'score': int(passing[pid]) if passing[pid] >= 0 else None}
+         for pid in range(len(seats))]
+    )
+    return int(len(flips))
+
+
+def day_enrollment(day_id):
+    data, accepted = consenting_applications(day_id)
+    seats = seat_array()
+
+    enrolled = np.zeros(len(seats), dtype=np.int64)
+    passing = np.full(len(seats), -1, dtype=np.int64)
+    for row in ProgramDayStats.query.filter_by(day_id=day_id).all():
+        if row.program_id < len(seats):
+            enrolled[row.program_id] = row.enrolled or 0
+            passing[row.program_id] = row.passing_score if row.passing_score is not None else -1
+
+    return DayEnrollment(data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4],
+                         accepted, enrolled, passing)
+
+
+def consent_rates(day_id, programs):
+    days = [d.id for d in CampaignDay.query.filter(CampaignDay.day <= db.session.query(CampaignDay.day)
+                                                    .filter_by(id=day_id).scalar_subquery())
+            .order_by(CampaignDay.day).all()]
+    earlier, later = db.aliased(Applicant), db.aliased(Applicant)
+    # Переходы согласий считаются в SQL: по строке на (программа, было, стало) с числом пар
+    pairs = [
+        int_rows(
+            db.session.query(later.program_id, earlier.consent, later.consent, func.count())
+            .join(later, (later.applicant_id == earlier.applicant_id) & (later.program_id == earlier.program_id))
+            .filter(earlier.day_id == before, later.day_id == after)
+            .group_by(later.program_id, earlier.consent, later.consent),
+            4
+        )
+        for before, after in zip(days, days[1:])
+    ]
+
+    if pairs and sum(len(rows) for rows in pairs):
+        data = np.concatenate(pairs)
+        data = np.repeat(data[:, :3], data[:, 3], axis=0)
+        return simulation.transition_rates(data[:, 0], data[:, 1], data[:, 2], programs,
+                                           app.config['SIMULATION_HORIZON_DAYS'])
+
+    # Одна дата: истории нет, берем текущую долю согласий как вероятность получить согласие
+    rows = int_rows(db.session.query(Applicant.program_id, Applicant.consent).filter_by(day_id=day_id), 2)
+    return simulation.consent_share(rows[:, 0], rows[:, 1], programs), np.zeros(programs)
+
+
+def run_simulation(day_id, trials=None, workers=None):
+    trials = trials or app.config['SIMULATION_TRIALS']
+    workers = workers or app.config['SIMULATION_WORKERS']
+    rows = int_rows(
+        db.session.query(Applicant.applicant_id, Applicant.program_id, Applicant.priority,
+                         Applicant.total, Applicant.consent)
+        .filter_by(day_id=day_id),
+        5
+    )
+    seats = seat_array()
+    gain, loss = consent_rates(day_id, len(seats))
+
+    probability = simulation.simulate(rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3], seats,
+                                      rows[:, 4].astype(bool), gain, loss, trials=trials, workers=workers)
+
+    AdmissionProbability.query.filter_by(day_id=day_id).delete()
+    version = data_version()
+    table = AdmissionProbability.__table__
+    records = [
+        {'applicant_id': int(applicant_id), 'day_id': day_id, 'program_id': int(program_id),
+         'probability': float(p), 'trials': trials, 'data_version': version}
+        for applicant_id, program_id, p in zip(rows[:, 0], rows[:, 1], probability)
+    ]
+    for i in range(0, len(records), 5000):
+        db.session.execute(table.insert(), records[i:i + 5000])
+    return len(records)
+
+
+def passing_score_of(result, program_id):
+    if program_id is None or program_id >= len(result.passing) or result.passing[program_id] < 0:
+        return 'НЕДОБОР'
+    return int(result.passing[program_id])
+
+
+def resolve_programs(names):
+    ids = dict(db.session.query(Program.name, Program.id).filter(Program.name.in_(names)).all())
+    for name in names:
+        if name not in ids:
+            program = Program(name=name, seats=PROGRAM_SEATS.get(name, 0))
+            db.session.add(program)
+            db.session.flush()
+            ids[name] = program.id
+    return ids
+
+
+# Дата списка приводится к виду ДД.ММ до любых сравнений: "4.8" и "04.08" - один день
+def parse_day_label(label):
+    try:
+        parsed = datetime.strptime(f"{label}.{app.config['CAMPAIGN_YEAR']}", "%d.%m.%Y").date()
+    except ValueError:
+        raise ValueError(f'Некорректная дата списка: {label}')
+    return parsed, parsed.strftime("%d.%m")
+
+
+def day_label(label):
+    return parse_day_label(label)[1]
+
+
+def resolve_day(label):
+    parsed, label = parse_day_label(label)
+    day = CampaignDay.query.filter_by(label=label).first()
+    if day is None:
+        day = CampaignDay(day=parsed, label=label)
+        db.session.add(day)
+        db.session.flush()
+    return day.id
+
+
+class UploadLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.String(20))
+    filename = db.Column(db.String(200))
+    file_hash = db.Column(db.String(64))
+    programs = db.Column(db.String(200))
+    rows = db.Column(db.Integer, default=0)
+    inserted = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)
+    deleted = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<UploadLog {self.date} {self.filename} +{self.inserted} ~{self.updated} -{self.deleted}>'
+
+
+class AdmissionProbability(db.Model):
+    applicant_id = db.Column(db.Integer, db.ForeignKey('person.id'), primary_key=True)
+    day_id = db.Column(db.Integer, db.ForeignKey('campaign_day.id'), primary_key=True)
+    program_id = db.Column(db.Integer, db.ForeignKey('program.id'), primary_key=True)
+    probability = db.Column(db.Float, nullable=False)
+    trials = db.Column(db.Integer, nullable=False)
+    data_version = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<AdmissionProbability {self.applicant_id} - {self.program_id}: {self.probability:.2f}>'
+
+
+class DatasetVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DatasetVersion {self.version}>'
+
+
+def data_version():
+    return db.session.query(DatasetVersion.version).filter_by(id=1).scalar() or 0
+
+
+def bump_data_version():
+    table = DatasetVersion.__table__
+    db.session.execute(
+        sqlite_insert(table).values(id=1, version=1)
+        .on_conflict_do_update(index_elements=['id'], set_={'version': table.c.version + 1})
+    )
+
+
+result_cache = cache.ResultCache(app.config['RESULT_CACHE_SIZE'])
+report_cache = cache.DiskCache(app.config['REPORT_FOLDER'], app.config['REPORT_CACHE_BYTES'])
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -183,24 +621,119 @@ def require_login():
 @app.route('/')
 @login_required
 def index():
-    dates = sorted(
-        {a.date for a in Applicant.query.all() if a.date},
-        key=lambda d: datetime.strptime(d, "%d.%m")
+    rows = (
+        db.session.query(Program.name, CampaignDay.label, ProgramDayStats.total, ProgramDayStats.consent)
+        .join(Program, Program.id == ProgramDayStats.program_id)
+        .join(CampaignDay, CampaignDay.id == ProgramDayStats.day_id)
+        .order_by(CampaignDay.day)
+        .all()
     )
 
+    dates = list(dict.fromkeys(label for _, label, _, _ in rows))
     programs = ['ПМ', 'ИВТ', 'ИТСС', 'ИБ']
-    stat = {}
+    stat = {prog: {date: {'total': 0, 'consent': 0} for date in dates} for prog in programs}
 
-    for prog in programs:
-        stat[prog] = {}
-        for date in dates:
-            count = Applicant.query.filter_by(program=prog, date=date).count()
-            consent_count = Applicant.query.filter_by(program=prog, date=date, consent=True).count()
-            stat[prog][date] = {'total': count, 'consent': consent_count}
+    for prog, date, total, consent in rows:
+        stat.setdefault(prog, {})[date] = {'total': total, 'consent': consent}
 
     return render_template('index.html', stats=stat, dates=dates, programs=programs)
 
 
+def is_unchanged_upload(date, digest):
+    last = (UploadLog.query.filter_by(date=date, file_hash=digest)
+            .order_by(UploadLog.id.desc()).first())
+    if last is None:
+        return False
+
+    programs = set(filter(None, last.programs.split(',')))
+    later = UploadLog.query.filter(UploadLog.date == date, UploadLog.id > last.id).all()
+    return not any(programs & set(filter(None, log.programs.split(','))) for log in later)
+
+
+APPLICATION_COLUMNS = ['applicant_id'] + ingest.VALUE_COLUMNS
+
+
+def application_rows(frame, program_ids, day_id):
+    rows = frame[APPLICATION_COLUMNS].assign(program_id=frame['program'].map(program_ids), day_id=day_id)
+    return ingest.to_records(rows)
+
+
+def apply_upload(date, filename, digest, frame):
+    programs = sorted(set(frame['program']))
+    program_ids = resolve_programs(programs)
+    program_names = {v: k for k, v in program_ids.items()}
+    day_id = resolve_day(date)
+    table = Applicant.__table__
+
+    existing = pd.DataFrame(
+        db.session.query(Applicant.id, Applicant.program_id, *[getattr(Applicant, col) for col in APPLICATION_COLUMNS])
+        .filter(Applicant.day_id == day_id, Applicant.program_id.in_(list(program_ids.values())))
+        .all(),
+        columns=['id', 'program_id'] + APPLICATION_COLUMNS
+    )
+    existing['program'] = existing['program_id'].map(program_names)
+    delta = ingest.diff_frames(existing, frame)
+
+    if len(delta.inserts):
+        persons = [{'id': i} for i in delta.inserts['applicant_id'].unique().tolist()]
+        db.session.execute(sqlite_insert(Person.__table__).on_conflict_do_nothing(), persons)
+        db.session.execute(table.insert(), application_rows(delta.inserts, program_ids, day_id))
+    if len(delta.updates):
+        values = {col: bindparam(col) for col in ingest.VALUE_COLUMNS}
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(values),
+            ingest.to_records(delta.updates[ingest.VALUE_COLUMNS].assign(row_id=delta.updates['id']))
+        )
+    for i in range(0, len(delta.deletes), 500):
+        db.session.execute(table.delete().where(table.c.id.in_(delta.deletes[i:i + 500])))
+
+    refresh_program_day_stats(day_id, program_ids.values())
+    migrations.rank_applications(db.session, day_id, program_ids.values())
+    update_enrollment(day_id)
+    bump_data_version()
+
+    log = UploadLog(
+        date=date,
+        filename=filename,
+        file_hash=digest,
+        programs=','.join(programs),
+        rows=len(frame),
+        inserted=len(delta.inserts),
+        updated=len(delta.updates),
+        deleted=len(delta.deletes)
+    )
+    db.session.add(log)
+    return log, delta
+
+
+def new_archive_spool():
+    if not app.config['ARCHIVE_UPLOADS']:
+        return None
+    return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_SIZE'])
+
+
+def close_spools(spools):
+    for spool in spools:
+        if spool is not None:
+            spool.close()
+
+
+def archive_after_response(spools):
+    spools = [(spool, date, name) for spool, date, name in spools if spool is not None]
+    if not spools:
+        return
+
+    def archive_all():
+        for spool, date, name in spools:
+            path = os.path.join(app.config['UPLOAD_FOLDER'], f"{date}_{secure_filename(name)}")
+            ingest.archive_spool(spool, path)
+
+    @after_this_request
+    def schedule_archive(response):
+        response.call_on_close(lambda: archive_executor.submit(archive_all))
+        return response
+
+
 @app.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
@@ -212,41 +745,32 @@ def upload():
             flash('Выберите файл и дату', 'danger')
             return redirect(url_for('upload'))
 
-        if not request.form.get("skip_clear"):
-            Applicant.query.filter_by(date=date).delete()
-            db.session.commit()
-
+        spool = None
         try:
-            filename = f"{date}_{file.filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-
-            df = pd.read_csv(filepath)
-
-            for _, row in df.iterrows():
-                if 'ID' in df.columns:
-                    app_id = int(row['ID'])
-                else:
-                    continue
-
-                applicant = Applicant(
-                    applicant_id=app_id,
-                    consent = True if str(row.get('Согласие')).strip() == '1' else False,
-                    priority=int(row.get('Приоритет', 1)),
-                    physics=int(row.get('Физика', 0)),
-                    russian=int(row.get('Русский', 0)),
-                    math=int(row.get('Математика', 0)),
-                    achievements=int(row.get('Достижения', 0)),
-                    total=int(row.get('Сумма', 0)),
-                    program=str(row.get('Программа', 'ПМ')),
-                    date=date
-                )
-                db.session.add(applicant)
-
+            start = time.perf_counter()
+            date = day_label(date)
+            spool = new_archive_spool()
+            frame, digest = ingest.read_stream(file.stream, date,
+                                               app.config['UPLOAD_CHUNK_ROWS'], spool)
+
+            if is_unchanged_upload(date, digest):
+                close_spools([spool])
+                flash(f'Нет изменений: файл {file.filename} за {date} уже загружен', 'info')
+                return redirect(url_for('index'))
+
+            log, _ = apply_upload(date, file.filename, digest, frame)
             db.session.commit()
-            flash(f'Данные за {date} успешно загружены!', 'success')
+            archive_after_response([(spool, date, file.filename)])
+
+            elapsed = time.perf_counter() - start
+            rate = len(frame) / elapsed if elapsed > 0 else len(frame)
+            flash(f'Данные за {date} успешно загружены! '
+                  f'{len(frame)} строк за {elapsed:.2f} с ({rate:.0f} строк/с): '
+                  f'добавлено {log.inserted}, изменено {log.updated}, удалено {log.deleted}', 'success')
 
         except Exception as e:
+            db.session.rollback()
+            close_spools([spool])
             flash(f'Ошибка: {str(e)}', 'danger')
 
         return redirect(url_for('index'))
@@ -254,51 +778,172 @@ def upload():
     return render_template('upload.html')
 
 
-@app.route('/lists')
+@app.route('/upload_batch', methods=['POST'])
 @login_required
-def lists():
-    program = request.args.get('program', 'all')
-    date = request.args.get('date', 'all')
-    show_consent = request.args.get('consent', 'all')
+def upload_batch():
+    items = []
 
-    query = Applicant.query
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        try:
+            items.extend((day_label(date), name, data, None) for date, name, data in ingest.iter_archive(archive.stream))
+        except Exception as e:
+            flash(f'Ошибка архива: {str(e)}', 'danger')
+            return redirect(url_for('upload'))
+
+    files = [f for f in request.files.getlist('csv_files') if f.filename]
+    dates = request.form.getlist('dates')
+    default_date = request.form.get('date')
+
+    file_dates = []
+    for i, file in enumerate(files):
+        date = dates[i] if i < len(dates) else default_date or ingest.date_from_name(file.filename)
+        if not date:
+            flash(f'Не указана дата для файла {file.filename}', 'danger')
+            return redirect(url_for('upload'))
+        try:
+            file_dates.append(day_label(date))
+        except ValueError as e:
+            flash(f'{file.filename}: {str(e)}', 'danger')
+            return redirect(url_for('upload'))
+    items.extend((date, file.filename, file.stream, new_archive_spool()) for date, file in zip(file_dates, files))
+
+    if not items:
+        flash('Выберите файлы или архив', 'danger')
+        return redirect(url_for('upload'))
+
+    try:
+        start = time.perf_counter()
+        parsed = ingest.parse_files(items, workers=app.config['UPLOAD_WORKERS'],
+                                    chunk_rows=app.config['UPLOAD_CHUNK_ROWS'])
+        batch_dates = sorted({item[0] for item in items})
+
+        applied = []
+        rows = inserted = updated = deleted = 0
+        for (date, name, _, spool), (frame, digest) in zip(items, parsed):
+            if is_unchanged_upload(date, digest):
+                close_spools([spool])
+                continue
+            log, _ = apply_upload(date, name, digest, frame)
+            applied.append((spool, date, name))
+            rows += log.rows
+            inserted += log.inserted
+            updated += log.updated
+            deleted += log.deleted
+        db.session.commit()
+        archive_after_response(applied)
 
+        elapsed = time.perf_counter() - start
+        rate = rows / elapsed if elapsed > 0 else rows
+        flash(f'Загружено файлов: {len(applied)} из {len(items)} за даты {", ".join(batch_dates)}. '
+              f'{rows} строк за {elapsed:.2f} с ({rate:.0f} строк/с): '
+              f'добавлено {inserted}, изменено {updated}, удалено {deleted}', 'success')
+
+    except Exception as e:
+        db.session.rollback()
+        close_spools([item[3] for item in items])
+        flash(f'Ошибка: {str(e)}', 'danger')
+
+    return redirect(url_for('index'))
+
+
+LIST_SORTS = {
+    'total': Applicant.total,
+    'id': Applicant.applicant_id,
+    'priority': Applicant.priority,
+}
+
+
+# Индексы выдачи начинаются с (day_id, program_id) или со столбца сортировки. Если задан
+# только один из этих фильтров, "+ 0" не дает SQLite выбрать индекс по нему и сортировать
+# четверть таблицы: страница читается по индексу сортировки с отбрасыванием лишних строк.
+def list_filters(program, date, show_consent):
+    conditions = []
+    seek = (program == 'all') == (date == 'all')
     if program != 'all':
-        query = query.filter_by(program=program)
+        column = Applicant.program_id if seek else Applicant.program_id + 0
+        conditions.append(column == select(Program.id).where(Program.name == program).scalar_subquery())
     if date != 'all':
-        query = query.filter_by(date=date)
+        column = Applicant.day_id if seek else Applicant.day_id + 0
+        conditions.append(column == select(CampaignDay.id).where(CampaignDay.label == date).scalar_subquery())
     if show_consent == 'yes':
-        query = query.filter_by(consent=True)
+        conditions.append(Applicant.consent == True)  # noqa: E712
     elif show_consent == 'no':
-        query = query.filter_by(consent=False)
+        conditions.append(Applicant.consent == False)  # noqa: E712
+    return conditions
+
+
+def list_counts(program, date, show_consent):
+    query = db.session.query(func.coalesce(func.sum(ProgramDayStats.total), 0),
+                             func.coalesce(func.sum(ProgramDayStats.consent), 0))
+    if program != 'all':
+        query = query.filter(ProgramDayStats.program_id == Program.id, Program.name == program)
+    if date != 'all':
+        query = query.filter(ProgramDayStats.day_id == CampaignDay.id, CampaignDay.label == date)
+    total, consent = query.one()
+
+    if show_consent == 'yes':
+        total = consent
+    elif show_consent == 'no':
+        total, consent = total - consent, 0
+    return total, consent
+
+
+def list_ordering(sort_by, order):
+    column = LIST_SORTS.get(sort_by, Applicant.total)
+    if order == 'asc':
+        return column.asc(), Applicant.id.asc()
+    return column.desc(), Applicant.id.desc()
+
+
+# Постраничная выборка по ключу (значение сортировки, id): следующая страница
+# начинается сразу после последней строки предыдущей, без OFFSET
+def list_page(program, date, show_consent, sort_by, order, after=None, limit=None):
+    limit = max(1, min(limit or app.config['LIST_PAGE_SIZE'], app.config['LIST_MAX_PAGE_SIZE']))
+    column = LIST_SORTS.get(sort_by, Applicant.total)
+    descending = order != 'asc'
+
+    query = Applicant.query.filter(*list_filters(program, date, show_consent))
+    if after:
+        value, row_id = (int(part) for part in after.split(':'))
+        key = tuple_(column, Applicant.id)
+        query = query.filter(key < (value, row_id) if descending else key > (value, row_id))
 
+    rows = query.order_by(*list_ordering(sort_by, order)).limit(limit + 1).all()
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = f"{getattr(rows[-1], column.key)}:{rows[-1].id}"
+    return rows, cursor
+
+
+@app.route('/lists')
+@login_required
+def lists():
+    program = request.args.get('program', 'all')
+    date = request.args.get('date', 'all')
+    show_consent = request.args.get('consent', 'all')
     sort_by = request.args.get('sort_by', 'total')
     order = request.args.get('order', 'desc')
 
-    if sort_by == 'total':
-        if order == 'desc':
-            applicants = query.order_by(Applicant.total.desc()).all()
-        else:
-            applicants = query.order_by(Applicant.total.asc()).all()
-    elif sort_by == 'id':
-        applicants = query.order_by(Applicant.applicant_id).all()
-    else:
-        applicants = query.all()
+    applicants, cursor = list_page(program, date, show_consent, sort_by, order)
 
-    dates = [d[0] for d in db.session.query(Applicant.date).distinct().all() if d[0]]
-    programs = [p[0] for p in db.session.query(Applicant.program).distinct().all() if p[0]]
-    total_count = len(applicants)
-    consent_count = len([a for a in applicants if a.consent])
+    dates = campaign_dates()
+    programs = loaded_programs()
+    total_count, consent_count = list_counts(program, date, show_consent)
     consent_percent = round((consent_count / total_count * 100), 1) if total_count > 0 else 0
 
     return render_template(
         'lists.html',
         applicants=applicants,
+        next_cursor=cursor,
         dates=dates,
         programs=programs,
         current_program=program,
         current_date=date,
         show_consent=show_consent,
+        sort_by=sort_by,
+        order=order,
         total_count=total_count,
         consent_count=consent_count,
         consent_percent=consent_percent,
@@ -306,15 +951,87 @@ def lists():
     )
 
 
-@app.route('/chart_data')
+@app.route('/lists/rows')
 @login_required
-def chart_data():
+def list_rows():
+    try:
+        applicants, cursor = list_page(
+            request.args.get('program', 'all'),
+            request.args.get('date', 'all'),
+            request.args.get('consent', 'all'),
+            request.args.get('sort_by', 'total'),
+            request.args.get('order', 'desc'),
+            request.args.get('after'),
+            request.args.get('limit', type=int)
+        )
+    except ValueError:
+        return {'error': 'Некорректный курсор страницы'}, 400
+
+    return {
+        'html': render_template('lists_rows.html', applicants=applicants),
+        'count': len(applicants),
+        'next': cursor
+    }
+
+
+EXPORT_COLUMNS = ['ID', 'Программа', 'Дата', 'Приоритет', 'Согласие',
+                  'Физика', 'Русский', 'Математика', 'Достижения', 'Сумма']
+
+
+@app.route('/lists/export')
+@login_required
+def export_list():
+    program = request.args.get('program', 'all')
+    date = request.args.get('date', 'all')
+    show_consent = request.args.get('consent', 'all')
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return {'error': f'Неизвестный формат выгрузки: {export_format}'}, 400
+
+    query = (
+        db.session.query(Applicant.applicant_id, Program.name, CampaignDay.label, Applicant.priority,
+                         Applicant.consent, Applicant.physics, Applicant.russian, Applicant.math,
+                         Applicant.achievements, Applicant.total)
+        .join(Program, Program.id == Applicant.program_id)
+        .join(CampaignDay, CampaignDay.id == Applicant.day_id)
+        .filter(*list_filters(program, date, show_consent))
+        .order_by(*list_ordering(request.args.get('sort_by', 'total'), request.args.get('order', 'desc')))
+    )
 
-    applicants = Applicant.query.all()
+    # Строки читаются курсором порциями и сразу уходят клиенту
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(EXPORT_COLUMNS)
 
-    scores = [app_.total for app_ in applicants]
+        for i, row in enumerate(query.yield_per(2000), 1):
+            if export_format == 'csv':
+                writer.writerow([*row[:4], int(bool(row[4])), *row[5:]])
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, [*row[:4], bool(row[4]), *row[5:]])),
+                                        ensure_ascii=False) + '\n')
+            if i % 2000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    filename = f"lists_{program}_{date}.{export_format}".replace('all', 'все')
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+
+def histogram_bins(count):
+    return min(10, max(5, count // 10))
 
-    if not scores:
+
+def histogram_payload(count, min_score, max_score, average, counts):
+    if not count:
         return {
             'labels': [],
             'data': [],
@@ -324,11 +1041,7 @@ def chart_data():
             'count': 0
         }
 
-    min_score = min(scores)
-    max_score = max(scores)
-    count = len(scores)
-
-    if count < 2:
+    if count < 2 or max_score == min_score:
         return {
             'labels': [f"{int(min_score)}"],
             'data': [count],
@@ -338,30 +1051,15 @@ def chart_data():
             'count': count
         }
 
-
-    num_bins = min(10, max(5, count // 10))
+    num_bins = histogram_bins(count)
     bin_width = (max_score - min_score) / num_bins
-
-    if bin_width == 0:
-        return {
-            'labels': [f"{int(min_score)}"],
-            'data': [count],
-            'average': min_score,
-            'max_score': max_score,
-            'min_score': min_score,
-            'count': count
-        }
-
-
     bins = []
     data = []
 
     for i in range(num_bins):
         bin_start = min_score + i * bin_width
         bin_end = bin_start + bin_width if i < num_bins - 1 else max_score + 0.1
-
-
-        count_in_bin = sum(1 for score in scores if bin_start <= score < bin_end)
+        count_in_bin = int(counts.get(i, 0))
 
         if count_in_bin > 0 or i == 0 or i == num_bins - 1:
             label = f"{int(bin_start)}-{int(bin_end)}"
@@ -371,15 +1069,126 @@ def chart_data():
     return {
         'labels': bins,
         'data': data,
-        'average': round(sum(scores) / count, 1),
+        'average': round(float(average), 1),
         'max_score': max_score,
         'min_score': min_score,
         'count': count
     }
 
 
+def score_distribution(program, date, show_consent):
+    conditions = [Applicant.total.isnot(None)]
+    if program != 'all':
+        conditions.append(Applicant.program == program)
+    if date != 'all':
+        conditions.append(Applicant.date == date)
+    if show_consent == 'yes':
+        conditions.append(Applicant.consent == True)  # noqa: E712
+    elif show_consent == 'no':
+        conditions.append(Applicant.consent == False)  # noqa: E712
+
+    count, min_score, max_score, average = (
+        db.session.query(func.count(Applicant.total), func.min(Applicant.total),
+                         func.max(Applicant.total), func.avg(Applicant.total))
+        .filter(*conditions)
+        .one()
+    )
+
+    if count < 2 or max_score == min_score:
+        return histogram_payload(count, min_score, max_score, average, {})
+
+    num_bins = histogram_bins(count)
+
+    # Номер интервала считается в SQL целочисленно: (балл - min) * bins // (max - min)
+    bin_index = case(
+        (Applicant.total == max_score, num_bins - 1),
+        else_=(Applicant.total - min_score) * num_bins // (max_score - min_score)
+    )
+    counts = dict(
+        db.session.query(bin_index, func.count())
+        .filter(*conditions)
+        .group_by(bin_index)
+        .all()
+    )
+    return histogram_payload(count, min_score, max_score, average, counts)
+
+
+@app.route('/chart_data')
+@login_required
+@cache.cached(result_cache, data_version)
+def chart_data():
+    return score_distribution(request.args.get('program', 'all'), request.args.get('date', 'all'),
+                              request.args.get('consent', 'all'))
+
+
+# Ряды по всем программам и датам за один проход по program_day_stats: проходной
+# балл (None - недобор), число согласий и заявлений на место.
+def program_dynamics(programs=None):
+    query = (
+        db.session.query(Program.name, Program.seats, CampaignDay.label, ProgramDayStats.total,
+                         ProgramDayStats.consent, ProgramDayStats.passing_score)
+        .join(Program, Program.id == ProgramDayStats.program_id)
+        .join(CampaignDay, CampaignDay.id == ProgramDayStats.day_id)
+        .order_by(CampaignDay.day, Program.id)
+    )
+    if programs:
+        query = query.filter(Program.name.in_(programs))
+    rows = query.all()
+
+    dates = list(dict.fromkeys(row.label for row in rows))
+    position = {label: i for i, label in enumerate(dates)}
+    series = {}
+    for row in rows:
+        if row.name not in series:
+            series[row.name] = {
+                'seats': row.seats,
+                'passing_score': [None] * len(dates),
+                'consent': [0] * len(dates),
+                'competition': [None] * len(dates)
+            }
+        entry = series[row.name]
+        i = position[row.label]
+        entry['passing_score'][i] = row.passing_score
+        entry['consent'][i] = row.consent or 0
+        entry['competition'][i] = round(row.total / row.seats, 2) if row.seats else None
+
+    return {'dates': dates, 'programs': series}
+
+
+@app.route('/dynamics')
+@login_required
+@cache.cached(result_cache, data_version)
+def dynamics():
+    program = request.args.get('program', 'all')
+    return program_dynamics([program] if program != 'all' else None)
+
+
+@app.route('/dynamics_chart')
+@login_required
+def dynamics_chart():
+    program = request.args.get('program', 'all')
+    version = data_version()
+    key = report_key('dynamics', program, 'all', True, version)
+    path = report_cache.get(key, '.png')
+    if not path:
+        trend = program_dynamics([program] if program != 'all' else None)
+        if not trend['dates']:
+            return {'error': 'Нет данных'}, 404
+
+        def write(target):
+            with open(target, 'wb') as f:
+                f.write(charts.render('dynamics', dates=trend['dates'], programs=trend['programs'],
+                                      title='Динамика по датам'))
+        path = report_cache.store(key, '.png', write)
+
+    response = send_file(os.path.abspath(path), mimetype='image/png', etag=key, conditional=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
 def save_charts_to_images(program='all', date='all'):
-    images = {}
+    specs = {}
 
     query = Applicant.query
     if program != 'all':
@@ -388,117 +1197,95 @@ def save_charts_to_images(program='all', date='all'):
         query = query.filter_by(date=date)
 
     applicants = query.all()
-    scores = [app.total for app in applicants if app.total]
+    scores = [applicant.total for applicant in applicants if applicant.total]
 
     if scores:
-        plt.figure(figsize=(8, 5))
-        plt.hist(scores, bins=10, edgecolor='black', alpha=0.7)
-        plt.xlabel('Сумма баллов')
-        plt.ylabel('Количество абитуриентов')
-        plt.title(f'Распределение баллов ({program if program != "all" else "Все программы"})')
-        plt.grid(True, alpha=0.3)
-
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        plt.close()
-
-        images['histogram'] = buf.getvalue()
+        specs['histogram'] = ('histogram', {
+            'scores': scores,
+            'title': f'Распределение баллов ({program if program != "all" else "Все программы"})'
+        })
 
         if program == 'all':
             programs_data = {}
-            for app in applicants:
-                if app.program not in programs_data:
-                    programs_data[app.program] = 0
-                programs_data[app.program] += 1
+            for applicant in applicants:
+                if applicant.program not in programs_data:
+                    programs_data[applicant.program] = 0
+                programs_data[applicant.program] += 1
 
             if programs_data:
-                plt.figure(figsize=(7, 7))
-                labels = list(programs_data.keys())
-                sizes = list(programs_data.values())
-
-                plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
-                plt.axis('equal')
-                plt.title('Распределение по программам')
-
-                buf2 = BytesIO()
-                plt.savefig(buf2, format='png', dpi=150, bbox_inches='tight')
-                plt.close()
-
-                images['pie_chart'] = buf2.getvalue()
-
-        dates = sorted(set([app.date for app in applicants if app.date]))
-        if len(dates) > 1 and program != 'all':
-            passing_scores = []
-            for d in dates:
-                daily_apps = [app for app in applicants if app.date == d and app.consent]
-                if daily_apps:
-                    daily_apps.sort(key=lambda x: x.total, reverse=True)
-                    seats = {'ПМ': 40, 'ИВТ': 50, 'ИТСС': 30, 'ИБ': 20}
-                    seat_count = seats.get(program, 20)
-                    if len(daily_apps) >= seat_count:
-                        passing_scores.append(daily_apps[seat_count - 1].total)
-                    else:
-                        passing_scores.append(daily_apps[-1].total if daily_apps else 0)
-                else:
-                    passing_scores.append(0)
-
-            plt.figure(figsize=(8, 5))
-            plt.plot(dates, passing_scores, marker='o', linewidth=2)
-            plt.xlabel('Дата')
-            plt.ylabel('Проходной балл')
-            plt.title(f'Динамика проходного балла ({program})')
-            plt.grid(True, alpha=0.3)
-            plt.xticks(rotation=45)
-
-            buf3 = BytesIO()
-            plt.savefig(buf3, format='png', dpi=150, bbox_inches='tight')
-            plt.close()
-
-            images['passing_scores'] = buf3.getvalue()
-
-    return images
-
-@app.route('/passing_scores')
-@login_required
-def passing_scores():
-    date = request.args.get('date', 'all')
+                specs['pie_chart'] = ('pie', {
+                    'labels': list(programs_data.keys()),
+                    'sizes': list(programs_data.values()),
+                    'title': 'Распределение по программам'
+                })
+
+        trend = program_dynamics([program] if program != 'all' else None)
+        if len(trend['dates']) > 1:
+            specs['passing_scores'] = ('dynamics', {
+                'dates': trend['dates'],
+                'programs': trend['programs'],
+                'title': f'Динамика по датам ({program if program != "all" else "Все программы"})'
+            })
+
+    return charts.render_many(specs, app.config['CHART_WORKERS'])
+
+def passing_summary(date):
+    seats = program_seats()
+    program_ids = dict(db.session.query(Program.name, Program.id).all())
+    day_id = day_id_of(date)
+    consenting = (Applicant.day_id == day_id, Applicant.consent == True)  # noqa: E712
+
+    passing = dict(
+        db.session.query(ProgramDayStats.program_id, ProgramDayStats.passing_score)
+        .filter_by(day_id=day_id)
+        .all()
+    )
 
-    seats = {
-        'ПМ': 40,
-        'ИВТ': 50,
-        'ИТСС': 30,
-        'ИБ': 20
-    }
+    counts = {}
+    for program_id, priority, count in (
+        db.session.query(Applicant.program_id, Applicant.priority, func.count())
+        .filter(*consenting)
+        .group_by(Applicant.program_id, Applicant.priority)
+        .all()
+    ):
+        counts.setdefault(program_id, {})[priority] = count
+
+    # Топ-5 баллов по каждому приоритету одним запросом с оконной функцией
+    ranked = (
+        select(
+            Applicant.program_id,
+            Applicant.priority,
+            Applicant.total,
+            func.row_number().over(
+                partition_by=(Applicant.program_id, Applicant.priority),
+                order_by=(Applicant.total.desc(), Applicant.applicant_id)
+            ).label('place')
+        )
+        .where(*consenting, Applicant.priority.between(1, 4))
+        .subquery()
+    )
+    top = {}
+    for program_id, priority, total in db.session.execute(
+        select(ranked.c.program_id, ranked.c.priority, ranked.c.total)
+        .where(ranked.c.place <= 5)
+        .order_by(ranked.c.program_id, ranked.c.priority, ranked.c.place)
+    ):
+        top.setdefault((program_id, priority), []).append(total)
 
-    programs = ['ПМ', 'ИВТ', 'ИТСС', 'ИБ']
     passing_data = {}
-
-    for prog in programs:
-        query = Applicant.query.filter_by(program=prog, consent=True)
-
-        if date != 'all':
-            query = query.filter_by(date=date)
-
-        applicants = query.order_by(Applicant.total.desc()).all()
-
-        if len(applicants) >= seats[prog]:
-            passing_score = applicants[seats[prog] - 1].total
-        else:
-            passing_score = 'НЕДОБОР'
-
-        priorities = {1: [], 2: [], 3: [], 4: []}
-        for app_ in applicants:
-            if 1 <= app_.priority <= 4:
-                priorities[app_.priority].append(app_)
+    for prog in PROGRAMS:
+        program_id = program_ids.get(prog)
+        program_counts = counts.get(program_id, {})
+        score = passing.get(program_id)
 
         passing_data[prog] = {
             'seats': seats[prog],
-            'total_applicants': len(applicants),
-            'passing_score': passing_score,
+            'total_applicants': sum(program_counts.values()),
+            'passing_score': score if score is not None else 'НЕДОБОР',
             'priorities': {
                 p: {
-                    'count': len(priorities[p]),
-                    'scores': [app_.total for app_ in priorities[p][:5]]  # Топ-5 баллов
+                    'count': program_counts.get(p, 0),
+                    'scores': top.get((program_id, p), [])  # Топ-5 баллов
                 }
                 for p in range(1, 5)
             }
@@ -507,61 +1294,121 @@ def passing_scores():
     return passing_data
 
 
-@app.route('/priority_cascade')
+@app.route('/passing_scores')
 @login_required
-def priority_cascade():
-    program = request.args.get('program', 'all')
+@cache.cached(result_cache, data_version)
+def passing_scores():
     date = request.args.get('date', 'all')
+    if date == 'all':
+        dates = campaign_dates()
+        date = dates[-1] if dates else None
+    return passing_summary(date)
 
-    query = Applicant.query.filter_by(consent=True)
 
+# Страница каскада: абитуриенты с согласием за день (по ключу Person.id после after)
+# и запрос их заявлений по всем программам в порядке приоритетов
+def cascade_page(program, day_id, after, limit):
+    program_id = None
     if program != 'all':
-        query = query.filter_by(program=program)
-    if date != 'all':
-        query = query.filter_by(date=date)
-
-    applicants = query.all()
-
-    applicants_by_id = {}
-    for app_ in applicants:
-        if app_.applicant_id not in applicants_by_id:
-            applicants_by_id[app_.applicant_id] = []
-        applicants_by_id[app_.applicant_id].append(app_)
-
-    cascade_data = []
-    for app_id, apps in list(applicants_by_id.items())[:50]:
-        apps.sort(key=lambda x: x.priority)
-
-        cascade_data.append({
-            'id': app_id,
-            'priorities': [
-                {
-                    'program': app_.program,
-                    'priority': app_.priority,
-                    'score': app_.total,
-                    'accepted': False
-                }
-                for app_ in apps
-            ]
+        program_id = db.session.query(Program.id).filter_by(name=program).scalar() or -1
+
+    conditions = [Applicant.day_id == day_id, Applicant.consent == True]  # noqa: E712
+    total = None
+    if after is None:
+        counted = db.session.query(func.count(Applicant.applicant_id.distinct())).filter(*conditions)
+        if program_id is not None:
+            counted = counted.filter(Applicant.program_id == program_id)
+        total = counted.scalar()
+
+    # Проверка на каждого Person идет по индексу (applicant_id, day_id): с равенством по
+    # program_id SQLite выбирает индекс (day_id, program_id, ...) и просматривает его целиком
+    # для каждого абитуриента, поэтому программа сравнивается через "+ 0"
+    applied = db.session.query(Applicant.id).filter(Applicant.applicant_id == Person.id, *conditions)
+    if program_id is not None:
+        applied = applied.filter(Applicant.program_id + 0 == program_id)
+    people = db.session.query(Person.id).filter(applied.exists())
+
+    if after is not None:
+        people = people.filter(Person.id > after)
+    page = [row.id for row in people.order_by(Person.id).limit(limit + 1).all()]
+    next_after = page[limit - 1] if len(page) > limit else None
+    page = page[:limit]
+
+    rows = (
+        db.session.query(Applicant.applicant_id, Applicant.program_id, Applicant.priority,
+                         Applicant.total, Applicant.enrolled)
+        .filter(*conditions, Applicant.applicant_id.in_(page))
+        .order_by(Applicant.applicant_id, Applicant.priority)
+    )
+    return rows, total, next_after
+
+
+def cascade_entries(rows):
+    current = None
+    for applicant_id, row_program, priority, score, enrolled in rows.yield_per(500):
+        if current is not None and current['id'] != applicant_id:
+            yield current
+            current = None
+        if current is None:
+            current = {'id': applicant_id, 'enrolled_program': None, 'priorities': []}
+        name = Program.name_of(row_program)
+        if enrolled:
+            current['enrolled_program'] = name
+        current['priorities'].append({
+            'program': name,
+            'priority': priority,
+            'score': score,
+            'accepted': bool(enrolled)
         })
-
-    return {
-        'cascade': cascade_data,
-        'total_applicants': len(applicants_by_id)
-    }
+    if current is not None:
+        yield current
 
 
-@app.route('/stats')
+@app.route('/priority_cascade')
 @login_required
-def stats():
-    seats = {'ПМ': 40, 'ИВТ': 50, 'ИТСС': 30, 'ИБ': 20}
-    dates = sorted(
-        {a.date for a in Applicant.query.all() if a.date},
-        key=lambda d: datetime.strptime(d, "%d.%m")
-    )
-    programs = ['ПМ', 'ИВТ', 'ИТСС', 'ИБ']
-
-    all_applicants = Applicant.query.all()
+def priority_cascade():
+    program = request.args.get('program', 'all')
+    date = request.args.get('date', 'all')
+    if date == 'all':
+        dates = campaign_dates()
+        date = dates[-1] if dates else None
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', app.config['CASCADE_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['CASCADE_MAX_PAGE_SIZE']))
+
+    rows, total, next_after = cascade_page(program, day_id_of(date), after, limit)
+
+    # Одна строка JSON на абитуриента, в конце - курсор следующей страницы
+    def generate():
+        for entry in cascade_entries(rows):
+            yield json.dumps(entry, ensure_ascii=False) + '\n'
+        yield json.dumps({
+            'next_after': next_after,
+            'total_applicants': total
+        }) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@cache.cached(result_cache, data_version)
+def collect_stats():
+    seats = program_seats()
+    dates = campaign_dates()
+    programs = PROGRAMS
+    program_ids = dict(db.session.query(Program.name, Program.id).all())
+    day_ids = dict(db.session.query(CampaignDay.label, CampaignDay.id).all())
+
+    totals = {
+        (row.program_id, row.day_id): row
+        for row in ProgramDayStats.query.all()
+    }
+    priority_counts = {}
+    for program_id, day_id, priority, count in (
+        db.session.query(Applicant.program_id, Applicant.day_id, Applicant.priority, func.count())
+        .group_by(Applicant.program_id, Applicant.day_id, Applicant.priority)
+        .all()
+    ):
+        priority_counts.setdefault((program_id, day_id), {})[priority] = count
 
     stats_data = {}
 
@@ -569,90 +1416,189 @@ def stats():
         stats_data[prog] = {'seats': seats[prog], 'by_date': {}}
 
     for date in dates:
-        all_apps_with_consent = [a for a in all_applicants if a.date == date and a.consent]
-
-        applicants_by_id = {}
-        for app_ in all_apps_with_consent:
-            if app_.applicant_id not in applicants_by_id:
-                applicants_by_id[app_.applicant_id] = []
-            applicants_by_id[app_.applicant_id].append(app_)
-
-        for app_id, apps in applicants_by_id.items():
-            apps.sort(key=lambda x: x.priority)
-
-        sorted_applicant_ids = sorted(
-            applicants_by_id.keys(),
-            key=lambda aid: (
-                max(app__.total for app__ in applicants_by_id[aid]),
-                -aid
-            ),
-            reverse=True
-        )
+        day_id = day_ids[date]
+        result = day_enrollment(day_id)
+        enrolled_ids = result.applicant_ids[result.accepted]
 
-        enrolled = {prog: [] for prog in programs}
-        already_enrolled = set()
+        for prog in programs:
+            program_id = program_ids.get(prog)
+            in_program = result.program_ids == program_id
+            enrolled = in_program & result.accepted
+            counts = priority_counts.get((program_id, day_id), {})
+            total = totals.get((program_id, day_id))
+
+            stats_data[prog]['by_date'][date] = {
+                'total': total.total if total else 0,
+                'total_consent': total.consent if total else 0,
+                'enrolled': int(enrolled.sum()),
+                'consent_not_enrolled': int(np.count_nonzero(
+                    ~np.isin(result.applicant_ids[in_program], enrolled_ids))),
+                'passing_score': passing_score_of(result, program_id),
+                'priority_counts': {p: counts.get(p, 0) for p in range(1, 5)},
+                'enrolled_by_priority': {
+                    p: int(np.count_nonzero(enrolled & (result.priorities == p))) for p in range(1, 5)
+                },
+                'enrolled_list': result.applicant_ids[enrolled].tolist()
+            }
 
-        for app_id in sorted_applicant_ids:
-            apps = applicants_by_id[app_id]
+    return stats_data, dates, programs
 
-            for app_ in apps:
-                program = app_.program
-                if len(enrolled[program]) < seats[program]:
-                    enrolled[program].append(app_)
-                    already_enrolled.add(app_id)
-                    break
 
-        for prog in programs:
-            enrolled[prog].sort(key=lambda x: x.total, reverse=True)
+ANALYTICS_PARTS = ('passing_scores', 'cascade', 'distribution', 'consent_distribution')
 
-        for prog in programs:
-            if len(enrolled[prog]) >= seats[prog]:
-                passing_score = enrolled[prog][seats[prog] - 1].total
-            else:
-                passing_score = 'НЕДОБОР'
 
-            all_apps_prog = [a for a in all_applicants if a.program == prog and a.date == date]
-            priority_counts = {1: 0, 2: 0, 3: 0, 4: 0}
-            for app_ in all_apps_prog:
-                if 1 <= app_.priority <= 4:
-                    priority_counts[app_.priority] += 1
+# Все части страницы списков одним запросом браузера: каждая часть берется тем же
+# SQL, что и отдельный маршрут, без выгрузки строк в Python
+@app.route('/analytics')
+@login_required
+@cache.cached(result_cache, data_version)
+def analytics():
+    program = request.args.get('program', 'all')
+    date = request.args.get('date', 'all')
+    include = [part for part in request.args.get('include', ','.join(ANALYTICS_PARTS)).split(',')
+               if part in ANALYTICS_PARTS]
+    limit = request.args.get('limit', app.config['CASCADE_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['CASCADE_MAX_PAGE_SIZE']))
+
+    dates = campaign_dates()
+    latest = date if date != 'all' else (dates[-1] if dates else None)
+
+    result = {'program': program, 'date': date}
+    if 'passing_scores' in include:
+        result['passing_scores'] = passing_summary(latest)
+
+    if 'cascade' in include:
+        rows, total, next_after = cascade_page(program, day_id_of(latest), None, limit)
+        result['cascade'] = {
+            'cascade': list(cascade_entries(rows)),
+            'total_applicants': total,
+            'next_after': next_after
+        }
 
-            enrolled_by_priority = {1: 0, 2: 0, 3: 0, 4: 0}
-            for app_ in enrolled[prog]:
-                if 1 <= app_.priority <= 4:
-                    enrolled_by_priority[app_.priority] += 1
+    if 'distribution' in include:
+        result['distribution'] = score_distribution(program, date, 'all')
 
-            all_enrolled_ids = set()
-            for apps_list in enrolled.values():
-                for app_ in apps_list:
-                    all_enrolled_ids.add(app_.applicant_id)
+    if 'consent_distribution' in include:
+        result['consent_distribution'] = score_distribution(program, date, 'yes')
 
-            consent_not_enrolled = 0
-            for app_ in all_apps_prog:
-                if app_.consent and app_.applicant_id not in already_enrolled:
-                    consent_not_enrolled += 1
+    return result
 
-            stats_data[prog]['by_date'][date] = {
-                'total': len(all_apps_prog),
-                'total_consent': len([a for a in all_apps_prog if a.consent]),
-                'enrolled': len(enrolled[prog]),
-                'consent_not_enrolled': consent_not_enrolled,
-                'passing_score': passing_score,
-                'priority_counts': priority_counts,
-                'enrolled_by_priority': enrolled_by_priority,
-                'enrolled_list': enrolled[prog]
-            }
 
+@app.route('/stats')
+@login_required
+def stats():
+    stats_data, dates, programs = collect_stats()
     return render_template('stats.html',
                            stats=stats_data,
                            dates=dates,
                            programs=programs)
 
 
+@app.route('/cache_stats')
+@login_required
+def cache_stats():
+    return {**result_cache.stats(), 'reports': report_cache.stats(), 'data_version': data_version()}
+
+
+@app.route('/applicant_status/<int:applicant_id>')
+@login_required
+def applicant_status(applicant_id):
+    rows = (
+        db.session.query(Applicant.program_id, Applicant.day_id, Applicant.priority, Applicant.consent,
+                         Applicant.total, Applicant.enrolled, Applicant.list_rank, Applicant.consent_rank,
+                         Program.seats, ProgramDayStats.passing_score, ProgramDayStats.total.label('list_size'))
+        .join(Program, Program.id == Applicant.program_id)
+        .outerjoin(ProgramDayStats, (ProgramDayStats.program_id == Applicant.program_id)
+                   & (ProgramDayStats.day_id == Applicant.day_id))
+        .filter(Applicant.applicant_id == applicant_id)
+        .all()
+    )
+    if not rows:
+        return {'error': f'Абитуриент {applicant_id} не найден'}, 404
+
+    days = {day.id: day for day in CampaignDay.query.filter(CampaignDay.id.in_({row.day_id for row in rows}))}
+    rows.sort(key=lambda row: (days[row.day_id].day, row.priority))
+
+    by_date = {}
+    for row in rows:
+        entry = by_date.setdefault(days[row.day_id].label, {'enrolled_program': None, 'applications': []})
+        program = Program.name_of(row.program_id)
+        if row.enrolled:
+            entry['enrolled_program'] = program
+        entry['applications'].append({
+            'program': program,
+            'priority': row.priority,
+            'consent': bool(row.consent),
+            'score': row.total,
+            'rank': row.list_rank,
+            'consent_rank': row.consent_rank,
+            'list_size': row.list_size,
+            'seats': row.seats,
+            'passing_score': row.passing_score if row.passing_score is not None else 'НЕДОБОР',
+            'to_passing_score': row.total - row.passing_score if row.passing_score is not None else None,
+            'enrolled': bool(row.enrolled)
+        })
+
+    dates = list(by_date)
+    return {
+        'applicant_id': applicant_id,
+        'latest_date': dates[-1],
+        'enrolled_program': by_date[dates[-1]]['enrolled_program'],
+        'by_date': by_date
+    }
+
+
+@app.route('/admission_probability/<int:applicant_id>')
+@login_required
+def admission_probability(applicant_id):
+    date = request.args.get('date')
+    if not date:
+        dates = campaign_dates()
+        date = dates[-1] if dates else None
+    day_id = day_id_of(date)
+
+    rows = (
+        db.session.query(Applicant.program_id, Applicant.priority, Applicant.consent, Applicant.total,
+                         AdmissionProbability.probability, AdmissionProbability.trials,
+                         AdmissionProbability.data_version)
+        .outerjoin(AdmissionProbability,
+                   (AdmissionProbability.applicant_id == Applicant.applicant_id)
+                   & (AdmissionProbability.day_id == Applicant.day_id)
+                   & (AdmissionProbability.program_id == Applicant.program_id))
+        .filter(Applicant.applicant_id == applicant_id, Applicant.day_id == day_id)
+        .order_by(Applicant.priority)
+        .all()
+    )
+    if not rows:
+        return {'error': f'Абитуриент {applicant_id} не найден за дату {date}'}, 404
+
+    versions = {row.data_version for row in rows if row.data_version is not None}
+    return {
+        'applicant_id': applicant_id,
+        'date': date,
+        'trials': max((row.trials or 0 for row in rows), default=0),
+        'stale': not versions or versions != {data_version()},
+        'programs': [
+            {
+                'program': Program.name_of(row.program_id),
+                'priority': row.priority,
+                'consent': bool(row.consent),
+                'score': row.total,
+                'probability': round(row.probability, 4) if row.probability is not None else None
+            }
+            for row in rows
+        ]
+    }
+
+
 @app.route('/clear')
 @login_required
 def clear_db():
     Applicant.query.delete()
+    ProgramDayStats.query.delete()
+    UploadLog.query.delete()
+    AdmissionProbability.query.delete()
+    bump_data_version()
     db.session.commit()
     flash('База данных очищена', 'info')
     return redirect(url_for('index'))
@@ -661,36 +1607,62 @@ def clear_db():
 @app.route('/reports')
 @login_required
 def reports_page():
-    dates = db.session.query(Applicant.date).distinct().all()
-    dates = [d[0] for d in dates if d[0]]
-    dates = sorted(
-        dates,
-        key=lambda d: datetime.strptime(d, "%d.%m")
-    )
+    dates = campaign_dates()
     programs = ['ПМ', 'ИВТ', 'ИТСС', 'ИБ']
-    return render_template('reports.html', dates=dates, programs=programs)
+    jobs = (
+        ReportJob.query.filter_by(user_id=current_user.id)
+        .order_by(ReportJob.created_at.desc())
+        .limit(10)
+        .all()
+    )
+    return render_template('reports.html', dates=dates, programs=programs,
+                           jobs=[job.to_dict() for job in jobs], current_job=request.args.get('job'))
 
 
-@app.route('/generate_report', methods=['POST'])
-@login_required
-def generate_report():
-    report_type = request.form.get('report_type', '').strip()
-    program = request.form.get('program', 'all').strip()
-    date = request.form.get('date', 'all').strip()
-    include_charts = request.form.get('include_charts') == 'on'
+def render_score_chart(path, scores):
+    with open(path, 'wb') as f:
+        f.write(charts.report_histogram(scores))
+
+
+def score_chart(program, date, version):
+    key = report_key('chart', program, date, True, version)
+    path = report_cache.get(key, '.png')
+    if path:
+        return path, None
+
+    query = db.session.query(Applicant.total).filter(Applicant.total.isnot(None))
+    if date != 'all':
+        query = query.filter(Applicant.date == date)
+    if program != 'all':
+        query = query.filter(Applicant.program == program)
+    scores = [total for total, in query.all()]
+
+    if len(scores) < 3:
+        return None, len(scores)
+    return report_cache.store(key, '.png', lambda target: render_score_chart(target, scores)), len(scores)
 
-    if not report_type:
-        flash('Выберите тип отчета', 'danger')
-        return redirect(url_for('reports_page'))
 
-    RUSSIAN_FONT = "RussianArial"
-    RUSSIAN_FONT_BOLD = "RussianArial"
-    print(f"Используем шрифт: {RUSSIAN_FONT}")
+def build_report(path, report_type, program, date, include_charts, version, full_list=False):
+    font = report_resources.fonts()
+    RUSSIAN_FONT = font.regular
+    RUSSIAN_FONT_BOLD = font.bold
 
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    c = canvas.Canvas(path, pagesize=A4)
     width, height = A4
 
+    conditions = []
+    if date != 'all':
+        conditions.append(Applicant.date == date)
+    if program != 'all':
+        conditions.append(Applicant.program == program)
+    total_rows = db.session.query(func.count(Applicant.id)).filter(*conditions).scalar()
+
+    def new_page():
+        c.setFont(RUSSIAN_FONT, 9)
+        c.drawString(50, 30, f"Всего записей: {total_rows}")
+        c.drawString(width - 150, 30, f"Страница {c.getPageNumber()}")
+        c.showPage()
+
     c.setFont(RUSSIAN_FONT_BOLD, 18)
     c.drawString(50, height - 40, "ОТЧЕТ ПО ПОСТУПЛЕНИЮ")
 
@@ -708,60 +1680,17 @@ def generate_report():
         print(f"\nСОЗДАНИЕ ГРАФИКОВ:")
 
         try:
-            import matplotlib
-            matplotlib.use('Agg')
-            import matplotlib.pyplot as plt
-            import numpy as np
-            from io import BytesIO
-
-            query = Applicant.query
-            if date != 'all':
-                query = query.filter_by(date=date)
-            if program != 'all':
-                query = query.filter_by(program=program)
-
-            applicants = query.all()
-            scores = [app.total for app in applicants if app.total is not None]
-
-            if scores and len(scores) >= 3:
-                plt.figure(figsize=(10, 6))
-                plt.hist(scores,
-                         bins=min(10, len(scores)),
-                         edgecolor='black',
-                         alpha=0.7,
-                         color='#2c80c9',
-                         rwidth=0.9)
-
-                avg = np.mean(scores)
-                plt.axvline(avg, color='red', linestyle='--', linewidth=2,
-                            label=f'Среднее: {avg:.1f}')
-
-                plt.title(f'Распределение баллов ({len(scores)} абитуриентов)',
-                          fontsize=14, fontweight='bold', pad=15)
-                plt.xlabel('Сумма баллов', fontsize=12, fontweight='bold')
-                plt.ylabel('Количество абитуриентов', fontsize=12, fontweight='bold')
-                plt.grid(True, alpha=0.3, linestyle=':')
-                plt.legend()
-                plt.tight_layout()
-
-                img_buffer = BytesIO()
-                plt.savefig(img_buffer, format='png', dpi=150,
-                            bbox_inches='tight', facecolor='white')
-                plt.close()
-
-                img_buffer.seek(0)
-                img_data = img_buffer.getvalue()
-
-                temp_file = "temp_chart_for_pdf.png"
-                with open(temp_file, 'wb') as f:
-                    f.write(img_data)
+            chart_path, count = score_chart(program, date, version)
+
+            if chart_path:
+                chart_image = ImageReader(chart_path)
 
                 c.setFont(RUSSIAN_FONT_BOLD, 14)
                 c.drawString(50, y_position, "ГРАФИК РАСПРЕДЕЛЕНИЯ БАЛЛОВ:")
                 y_position -= 25
 
                 if y_position < 200:
-                    c.showPage()
+                    new_page()
                     y_position = height - 50
                     c.setFont(RUSSIAN_FONT_BOLD, 14)
                     c.drawString(50, y_position, "ГРАФИК РАСПРЕДЕЛЕНИЯ БАЛЛОВ:")
@@ -772,7 +1701,7 @@ def generate_report():
                     if img_y < 50:
                         img_y = height - 230
 
-                    c.drawImage(temp_file,
+                    c.drawImage(chart_image,
                                 50, img_y,
                                 width=500, height=180,
                                 preserveAspectRatio=True)
@@ -783,15 +1712,10 @@ def generate_report():
                 except Exception as img_err:
                     print(f"Ошибка вставки изображения: {img_err}")
 
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-
             else:
                 c.setFont(RUSSIAN_FONT, 10)
                 c.drawString(50, y_position,
-                             f"Недостаточно данных для графика ({len(scores)} записей)")
+                             f"Недостаточно данных для графика ({count} записей)")
                 y_position -= 20
 
         except Exception as e:
@@ -800,17 +1724,20 @@ def generate_report():
             c.drawString(50, y_position, f"Ошибка: {str(e)[:60]}")
             y_position -= 20
 
-    query = Applicant.query
-    if date != 'all':
-        query = query.filter_by(date=date)
-    if program != 'all':
-        query = query.filter_by(program=program)
-
-    applicants = query.order_by(Applicant.total.desc()).all()
+    rows = (
+        db.session.query(Applicant.applicant_id, Program.name, Applicant.priority, Applicant.physics,
+                         Applicant.russian, Applicant.math, Applicant.achievements, Applicant.total,
+                         Applicant.consent)
+        .join(Program, Program.id == Applicant.program_id)
+        .filter(*conditions)
+        .order_by(Applicant.total.desc(), Applicant.applicant_id)
+    )
+    if not full_list:
+        rows = rows.limit(50)
 
-    if applicants:
+    if total_rows:
         if y_position < 100:
-            c.showPage()
+            new_page()
             y_position = height - 50
 
         c.setFont(RUSSIAN_FONT_BOLD, 14)
@@ -820,34 +1747,36 @@ def generate_report():
         headers = ["ID", "Программа", "Приор", "Физ", "Рус", "Мат", "Дост", "Сумма", "Согл"]
         col_widths = [50, 70, 40, 40, 40, 40, 45, 50, 40]
 
-        x = 30
-        c.setFont(RUSSIAN_FONT_BOLD, 10)
-        for i, header in enumerate(headers):
-            c.drawString(x, y_position, header)
-            x += col_widths[i]
-
-        c.line(30, y_position - 2, 30 + sum(col_widths), y_position - 2)
-        y_position -= 20
-
-        c.setFont(RUSSIAN_FONT, 9)
-
-        for app in applicants[:50]:
+        def table_header(y):
+            x = 30
+            c.setFont(RUSSIAN_FONT_BOLD, 10)
+            for i, header in enumerate(headers):
+                c.drawString(x, y, header)
+                x += col_widths[i]
+            c.line(30, y - 2, 30 + sum(col_widths), y - 2)
+            c.setFont(RUSSIAN_FONT, 9)
+            return y - 20
+
+        y_position = table_header(y_position)
+
+        # Строки читаются курсором порциями, в памяти - только текущая страница
+        for applicant_id, program_name, priority, physics, russian, math, achievements, total, consent \
+                in rows.yield_per(1000):
             if y_position < 50:
-                c.showPage()
-                y_position = height - 50
-                c.setFont(RUSSIAN_FONT, 9)
+                new_page()
+                y_position = table_header(height - 50)
 
             x = 30
             data = [
-                str(app.applicant_id),
-                app.program,
-                str(app.priority),
-                str(app.physics),
-                str(app.russian),
-                str(app.math),
-                str(app.achievements),
-                str(app.total),
-                "ДА" if app.consent else "НЕТ"
+                str(applicant_id),
+                program_name,
+                str(priority),
+                str(physics),
+                str(russian),
+                str(math),
+                str(achievements),
+                str(total),
+                "ДА" if consent else "НЕТ"
             ]
 
             for j, item in enumerate(data):
@@ -857,24 +1786,304 @@ def generate_report():
             y_position -= 15
 
     c.setFont(RUSSIAN_FONT, 9)
-    c.drawString(50, 30, f"Всего записей: {len(applicants)}")
+    c.drawString(50, 30, f"Всего записей: {total_rows}")
     c.drawString(width - 150, 30, f"Страница {c.getPageNumber()}")
+    pages = c.getPageNumber()
 
     c.save()
-    buffer.seek(0)
+    return pages
+
+
+REPORT_ACTIVE = ('queued', 'running')
+report_locks = {}
+report_locks_guard = threading.Lock()
+
+
+class ReportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    cache_key = db.Column(db.String(64), index=True, nullable=False)
+    report_type = db.Column(db.String(20), nullable=False)
+    program = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.String(5), nullable=False)
+    include_charts = db.Column(db.Boolean, default=False)
+    full_list = db.Column(db.Boolean, default=False)
+    data_version = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(10), default='queued', index=True)
+    path = db.Column(db.String(300))
+    error = db.Column(db.String(500))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime)
+    pages = db.Column(db.Integer)
+    seconds = db.Column(db.Float)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'report_type': self.report_type,
+            'program': self.program,
+            'date': self.date,
+            'include_charts': self.include_charts,
+            'full_list': self.full_list,
+            'pages': self.pages,
+            'pages_per_second': round(self.pages / self.seconds, 1) if self.pages and self.seconds else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'download_url': url_for('download_report', job_id=self.id) if self.status == 'done' else None
+        }
+
 
-    print(f"\nPDF успешно создан")
-    print("=" * 80 + "\n")
+def report_key(report_type, program, date, include_charts, version, full_list=False):
+    raw = json.dumps([report_type, program, date, include_charts, version, full_list])
+    return hashlib.sha256(raw.encode()).hexdigest()
 
-    filename = f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
 
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/pdf'
+def report_lock(key):
+    with report_locks_guard:
+        return report_locks.setdefault(key, threading.Lock())
+
+
+def run_report_job(job_id):
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        def build(target):
+            start = time.perf_counter()
+            job.pages = build_report(target, job.report_type, job.program, job.date,
+                                     job.include_charts, job.data_version, job.full_list)
+            job.seconds = time.perf_counter() - start
+            print(f"Отчет {job.id}: {job.pages} стр. за {job.seconds:.1f} с "
+                  f"({job.pages / max(job.seconds, 1e-9):.1f} стр/с)")
+
+        try:
+            # Одинаковые задания разных пользователей строят файл один раз, второе ждет и берет его из кэша
+            with report_lock(job.cache_key):
+                job.path = report_cache.get(job.cache_key, '.pdf') or report_cache.store(job.cache_key, '.pdf', build)
+            job.status = 'done'
+        except Exception as e:
+            job.status, job.error = 'error', str(e)[:500]
+            print(f"Ошибка построения отчета {job.id}: {e}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            db.session.commit()
+
+
+def submit_report(report_type, program, date, include_charts, full_list=False):
+    version = data_version()
+    key = report_key(report_type, program, date, include_charts, version, full_list)
+
+    # Свой запрос того же отчета по тем же данным уже построен или строится - отдаем его
+    existing = (
+        ReportJob.query
+        .filter(ReportJob.cache_key == key, ReportJob.user_id == current_user.id,
+                ReportJob.status.in_(REPORT_ACTIVE + ('done',)))
+        .order_by(ReportJob.created_at.desc())
+        .first()
     )
-    
+    if existing and (existing.status != 'done' or report_cache.get(key, '.pdf')):
+        return existing
+
+    # Файл уже построен для другого пользователя - свое готовое задание ссылается на него
+    path = report_cache.get(key, '.pdf')
+    if path:
+        source = ReportJob.query.filter_by(cache_key=key, status='done').order_by(ReportJob.created_at.desc()).first()
+        job = ReportJob(cache_key=key, report_type=report_type, program=program, date=date,
+                        include_charts=include_charts, full_list=full_list, data_version=version,
+                        user_id=current_user.id, status='done', path=path,
+                        pages=source.pages if source else None, finished_at=datetime.now(timezone.utc))
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    if ReportJob.query.filter(ReportJob.status.in_(REPORT_ACTIVE)).count() >= app.config['REPORT_QUEUE_LIMIT']:
+        return None
+
+    job = ReportJob(cache_key=key, report_type=report_type, program=program, date=date,
+                    include_charts=include_charts, full_list=full_list, data_version=version,
+                    user_id=current_user.id)
+    db.session.add(job)
+    db.session.commit()
+    report_executor.submit(run_report_job, job.id)
+    return job
+
+
+@app.route('/generate_report', methods=['POST'])
+@login_required
+def generate_report():
+    report_type = request.form.get('report_type', '').strip()
+    program = request.form.get('program', 'all').strip()
+    date = request.form.get('date', 'all').strip()
+    include_charts = request.form.get('include_charts') == 'on'
+    full_list = request.form.get('full_list') == 'on'
+
+    if not report_type:
+        flash('Выберите тип отчета', 'danger')
+        return redirect(url_for('reports_page'))
+
+    job = submit_report(report_type, program, date, include_charts, full_list)
+    if job is None:
+        flash('Сейчас строится слишком много отчетов, попробуйте через минуту', 'warning')
+        return redirect(url_for('reports_page'))
+
+    if job.status == 'done':
+        flash('Отчет по этим данным уже построен', 'info')
+    else:
+        flash('Отчет поставлен в очередь, ссылка появится после построения', 'info')
+    return redirect(url_for('reports_page', job=job.id))
+
+
+@app.route('/report_jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        return {'error': 'Задание не найдено'}, 404
+    return job.to_dict()
+
+
+@app.route('/report_jobs/<job_id>/download')
+@login_required
+def download_report(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if job is not None and job.user_id != current_user.id:
+        job = None
+    path = report_cache.get(job.cache_key, '.pdf') if job is not None and job.status == 'done' else None
+    if path is None:
+        flash('Отчет не найден или уже удален из кэша, постройте его заново', 'warning')
+        return redirect(url_for('reports_page'))
+
+    # ETag - ключ отчета: повторная загрузка тех же данных получает 304 без тела
+    filename = f"report_{job.report_type}_{job.created_at.strftime('%Y%m%d_%H%M%S')}.pdf"
+    response = send_file(os.path.abspath(path), as_attachment=True, download_name=filename,
+                         mimetype='application/pdf', etag=job.cache_key, conditional=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def init_db():
+    applied = migrations.upgrade(db.engine, db.metadata,
+                                 {'year': app.config['CAMPAIGN_YEAR'], 'seats': PROGRAM_SEATS})
+    resolve_programs(list(PROGRAM_SEATS))
+    ReportJob.query.filter(ReportJob.status.in_(REPORT_ACTIVE)).update(
+        {'status': 'error', 'error': 'Построение прервано перезапуском сервера'}, synchronize_session=False)
+    if any(number == migrations.ENROLLMENT_VERSION for number, _ in applied):
+        for day_id, in db.session.query(CampaignDay.id).all():
+            update_enrollment(day_id)
+        bump_data_version()
+    db.session.commit()
+
+
+@app.cli.command('recompute-enrollment')
+def recompute_enrollment():
+    for day_id, label in db.session.query(CampaignDay.id, CampaignDay.label).order_by(CampaignDay.day).all():
+        start = time.perf_counter()
+        changed = update_enrollment(day_id)
+        print(f"{label}: изменено зачислений {changed} за {(time.perf_counter() - start) * 1000:.0f} мс")
+    bump_data_version()
+    db.session.commit()
+
+
+@app.cli.command('simulate')
+@click.option('--date', default=None, help='Дата в формате ДД.ММ (по умолчанию последняя)')
+@click.option('--trials', default=None, type=int, help='Количество попыток')
+@click.option('--workers', default=None, type=int, help='Количество процессов')
+def simulate_command(date, trials, workers):
+    if date is None:
+        dates = campaign_dates()
+        date = dates[-1] if dates else None
+    day_id = day_id_of(date)
+    if day_id is None:
+        print(f"Нет данных за дату {date}")
+        return
+
+    start = time.perf_counter()
+    count = run_simulation(day_id, trials, workers)
+    db.session.commit()
+    print(f"{date}: вероятности для {count} заявлений за {time.perf_counter() - start:.1f} с")
+
+
+# Планы проверяются у тех запросов, которые выполняют сами страницы: построители вызываются
+# на имеющихся данных, их SQL перехватывается и разбирается через EXPLAIN QUERY PLAN
+def record_statements(run):
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT') \
+                and f'FROM {Applicant.__tablename__}' in statement:
+            statements.setdefault(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def index_checks(program, date):
+    checks = {'index: даты и программы': lambda: (campaign_dates(), loaded_programs())}
+    for list_program, list_date in [(program, date), (program, 'all'), ('all', date), ('all', 'all')]:
+        for sort_by in LIST_SORTS:
+            def page(list_program=list_program, list_date=list_date, sort_by=sort_by):
+                _, cursor = list_page(list_program, list_date, 'all', sort_by, 'desc')
+                if cursor:
+                    list_page(list_program, list_date, 'all', sort_by, 'desc', cursor)
+            checks[f'lists: {list_program}/{list_date}/{sort_by}'] = page
+    checks['lists: согласие'] = lambda: list_page(program, date, 'yes', 'total', 'asc')
+    checks['passing_scores'] = lambda: passing_summary(date)
+
+    def cascade(cascade_program):
+        rows, _, next_after = cascade_page(cascade_program, day_id_of(date), None, 20)
+        list(cascade_entries(rows))
+        if next_after is not None:
+            list(cascade_entries(cascade_page(cascade_program, day_id_of(date), next_after, 20)[0]))
+    checks['priority_cascade'] = lambda: cascade(program)
+    checks['priority_cascade: все программы'] = lambda: cascade('all')
+
+    def report(report_program, report_date):
+        with tempfile.TemporaryDirectory() as folder:
+            build_report(os.path.join(folder, 'check.pdf'), 'detailed', report_program, report_date,
+                         False, data_version())
+    checks['generate_report'] = lambda: report(program, date)
+    checks['generate_report: все'] = lambda: report('all', 'all')
+
+    rows, _ = list_page(program, date, 'all', 'total', 'desc', limit=1)
+    user = User.query.first()
+
+    def applicant(route):
+        if rows and user:
+            with app.test_request_context():
+                login_user(user)
+                route(rows[0].applicant_id)
+    checks['applicant_status'] = lambda: applicant(applicant_status)
+    checks['admission_probability'] = lambda: applicant(admission_probability)
+    return checks
+
+
+@app.cli.command('check-indexes')
+def check_indexes():
+    dates, programs = campaign_dates(), loaded_programs()
+    if not dates or not programs:
+        print("Нет данных для проверки планов запросов")
+        return
+
+    failed = 0
+    for name, run in index_checks(programs[0], dates[-1]).items():
+        with db.engine.connect() as conn:
+            for statement, params in record_statements(run).items():
+                plan = migrations.explain(conn, statement, params)
+                ok = migrations.uses_index(plan, Applicant.__tablename__)
+                failed += not ok
+                print(f"{'OK ' if ok else 'FAIL'} {name}: {'; '.join(plan)}")
+
+    if failed:
+        raise SystemExit(1)
+
+
 def create_admin_user():
     if not User.query.filter_by(username='admin').first():
         admin = User(username='admin', email='admin@example.com', role='admin')
@@ -885,6 +2094,6 @@ def create_admin_user():
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
         create_admin_user()
     app.run(debug=True, port=5000)
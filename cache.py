@@ -0,0 +1,149 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+
+
+class ResultCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard_older(self, version):
+        with self.lock:
+            for key in [k for k in self.entries if k[-1] < version]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / requests, 3) if requests else 0.0
+            }
+
+
+class DiskCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key, suffix):
+        return os.path.join(self.folder, f'{key}{suffix}')
+
+    def get(self, key, suffix):
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def store(self, key, suffix, write):
+        path = self.path(key, suffix)
+        partial = f'{path}.{uuid.uuid4().hex}.part'
+        try:
+            write(partial)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        self.evict(keep=path)
+        return path
+
+    # Вытесняются файлы, к которым дольше всего не обращались (mtime обновляется в get)
+    def evict(self, keep=None):
+        with self.lock:
+            files = []
+            for entry in os.scandir(self.folder):
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    info = entry.stat()
+                    files.append((info.st_mtime, info.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+            return total
+
+    def stats(self):
+        size = sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.is_file())
+        return {
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+# Ключ: (функция, ее аргументы, аргументы запроса, версия данных). После загрузки
+# или очистки версия растет, и старые записи просто перестают находиться.
+def cached(cache, version):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = version()
+            key = (
+                view.__name__,
+                args,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                current
+            )
+            found, value = cache.get(key)
+            if found:
+                return value
+
+            value = view(*args, **kwargs)
+            cache.discard_older(current)
+            cache.put(key, value)
+            return value
+        return wrapper
+    return decorator
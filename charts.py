@@ -0,0 +1,121 @@
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+
+
+def _png(figure, dpi=150):
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight', facecolor='white')
+    return buffer.getvalue()
+
+
+def report_histogram(scores):
+    figure = Figure(figsize=(10, 6))
+    ax = figure.subplots()
+    ax.hist(scores,
+            bins=min(10, len(scores)),
+            edgecolor='black',
+            alpha=0.7,
+            color='#2c80c9',
+            rwidth=0.9)
+
+    avg = np.mean(scores)
+    ax.axvline(avg, color='red', linestyle='--', linewidth=2,
+               label=f'Среднее: {avg:.1f}')
+
+    ax.set_title(f'Распределение баллов ({len(scores)} абитуриентов)',
+                 fontsize=14, fontweight='bold', pad=15)
+    ax.set_xlabel('Сумма баллов', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Количество абитуриентов', fontsize=12, fontweight='bold')
+    ax.grid(True, alpha=0.3, linestyle=':')
+    ax.legend()
+    figure.tight_layout()
+    return _png(figure)
+
+
+def histogram(scores, title):
+    figure = Figure(figsize=(8, 5))
+    ax = figure.subplots()
+    ax.hist(scores, bins=10, edgecolor='black', alpha=0.7)
+    ax.set_xlabel('Сумма баллов')
+    ax.set_ylabel('Количество абитуриентов')
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+    return _png(figure)
+
+
+def pie(labels, sizes, title):
+    figure = Figure(figsize=(7, 7))
+    ax = figure.subplots()
+    ax.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')
+    ax.set_title(title)
+    return _png(figure)
+
+
+def dynamics(dates, programs, title):
+    figure = Figure(figsize=(9, 10))
+    axes = figure.subplots(3, 1, sharex=True)
+    panels = [
+        ('passing_score', 'Проходной балл'),
+        ('consent', 'Согласий'),
+        ('competition', 'Заявлений на место'),
+    ]
+    x = np.arange(len(dates))
+    for ax, (field, label) in zip(axes, panels):
+        for name, series in programs.items():
+            # None (недобор, нет данных за дату) - разрыв линии
+            y = np.array([np.nan if v is None else v for v in series[field]], dtype=float)
+            ax.plot(x, y, marker='o', linewidth=2, label=name)
+        ax.set_ylabel(label)
+        ax.grid(True, alpha=0.3)
+    axes[0].set_title(title)
+    axes[0].legend()
+    axes[-1].set_xticks(x, dates, rotation=45)
+    axes[-1].set_xlabel('Дата')
+    figure.tight_layout()
+    return _png(figure)
+
+
+CHARTS = {
+    'report_histogram': report_histogram,
+    'histogram': histogram,
+    'pie': pie,
+    'dynamics': dynamics,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _render(spec):
+    kind, kwargs = spec
+    return CHARTS[kind](**kwargs)
+
+
+def _executor(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: дочерние процессы не наследуют потоки и открытые соединения веб-сервера
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+# Каждый график - отдельная Figure без общего состояния pyplot, поэтому их можно
+# строить параллельно: в потоках или, при workers > 1, в пуле процессов.
+def render_many(specs, workers=1):
+    if workers <= 1 or len(specs) < 2:
+        return {name: _render(spec) for name, spec in specs.items()}
+
+    names = list(specs)
+    images = _executor(workers).map(_render, [specs[name] for name in names])
+    return dict(zip(names, images))
+
+
+def render(kind, **kwargs):
+    return _render((kind, kwargs))
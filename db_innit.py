@@ -1,5 +1,5 @@
-from app import app, db
+from app import app, init_db
 
 with app.app_context():
-    db.create_all()
+    init_db()
     print("База данных создана.")
\ No newline at end of file
@@ -0,0 +1,151 @@
+import time
+
+import numpy as np
+
+
+def _prepare(applicant_ids, program_codes, priorities, scores, seats):
+    applicant_ids = np.asarray(applicant_ids, dtype=np.int64)
+    program_codes = np.asarray(program_codes, dtype=np.int64)
+    priorities = np.asarray(priorities, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.int64)
+    seats = np.asarray(seats, dtype=np.int64)
+    n = len(applicant_ids)
+
+    pref = np.lexsort((priorities, applicant_ids))
+    applicant_codes = np.unique(applicant_ids[pref], return_inverse=True)[1].reshape(-1)
+    starts = np.flatnonzero(np.r_[True, applicant_codes[1:] != applicant_codes[:-1]]) if n else pref
+    ends = np.r_[starts[1:], n]
+
+    prog = program_codes[pref]
+    valid = (prog >= 0) & (prog < len(seats))
+    prog_seats = np.where(valid, seats[np.clip(prog, 0, max(len(seats) - 1, 0))] if len(seats) else 0, 0)
+
+    ranked = np.lexsort((applicant_ids[pref], -scores[pref], prog))
+    key = np.empty(n, dtype=np.int64)
+    key[ranked] = np.arange(n)
+
+    return pref, applicant_codes, starts, ends, prog, prog_seats, key
+
+
+def _deferred_acceptance(applicant_codes, ends, prog, prog_seats, key, ptr, held, proposers):
+    while True:
+        candidates = np.concatenate([held, ptr[proposers]])
+        candidates = candidates[np.argsort(key[candidates], kind='stable')]
+
+        group = prog[candidates]
+        first = np.r_[True, group[1:] != group[:-1]]
+        positions = np.arange(len(candidates))
+        rank = positions - np.maximum.accumulate(np.where(first, positions, 0))
+        keep = rank < prog_seats[candidates]
+
+        held = candidates[keep]
+        rejected = candidates[~keep]
+        rejected_applicants = applicant_codes[rejected]
+        ptr[rejected_applicants] = rejected + 1
+        proposers = rejected_applicants[ptr[rejected_applicants] < ends[rejected_applicants]]
+
+        if not len(proposers):
+            return held
+
+
+# Отложенное принятие: абитуриент идет по своим приоритетам, программа держит
+# лучших по баллу (при равенстве - меньший ID) в пределах мест.
+def enroll(applicant_ids, program_codes, priorities, scores, seats):
+    n = len(applicant_ids)
+    accepted = np.zeros(n, dtype=bool)
+    if n == 0:
+        return accepted
+
+    pref, applicant_codes, starts, ends, prog, prog_seats, key = _prepare(
+        applicant_ids, program_codes, priorities, scores, seats)
+
+    held = _deferred_acceptance(applicant_codes, ends, prog, prog_seats, key,
+                                starts.copy(), np.empty(0, dtype=np.int64), np.arange(len(starts)))
+    accepted[pref[held]] = True
+    return accepted
+
+
+# Пересчет после изменения части заявлений. Прежний отказ программы p остается в силе,
+# только если никто из подававших в p не изменился: тогда этот кусок прошлого прогона
+# повторяется и на новых данных. Поэтому "заражаем" программы, где менялись заявления,
+# и все программы из списков измененных абитуриентов; кому отказала зараженная
+# программа - подает заново и заражает все программы, куда подавал раньше. Остальные
+# сохраняют места, и отложенное принятие дает тот же результат, что и enroll().
+def reenroll(applicant_ids, program_codes, priorities, scores, seats, previous, changed, programs):
+    n = len(applicant_ids)
+    accepted = np.zeros(n, dtype=bool)
+    if n == 0:
+        return accepted
+
+    pref, applicant_codes, starts, ends, prog, prog_seats, key = _prepare(
+        applicant_ids, program_codes, priorities, scores, seats)
+    applicants = len(starts)
+
+    previous = np.asarray(previous, dtype=bool)[pref]
+    holding = np.full(applicants, -1, dtype=np.int64)
+    holding[applicant_codes[previous]] = np.flatnonzero(previous)
+    ptr = np.where(holding >= 0, holding, ends)
+
+    # Недопустимые коды программ собираются в дополнительную ячейку
+    slots = max(len(seats), int(prog.max()) + 1) + 1
+    slot = np.where(prog >= 0, prog, slots - 1)
+    positions = np.arange(n)
+    skipped = positions < ptr[applicant_codes]
+    proposed = skipped | (positions == holding[applicant_codes])
+
+    reset = np.zeros(applicants, dtype=bool)
+    changed = np.asarray(sorted(changed), dtype=np.int64)
+    reset[applicant_codes[np.isin(np.asarray(applicant_ids, dtype=np.int64)[pref], changed)]] = True
+
+    tainted = np.zeros(slots, dtype=bool)
+    programs = np.asarray(sorted(programs), dtype=np.int64)
+    tainted[programs[(programs >= 0) & (programs < slots - 1)]] = True
+    tainted[slot[reset[applicant_codes]]] = True
+
+    while True:
+        tainted[slot[proposed & reset[applicant_codes]]] = True
+        newly = np.unique(applicant_codes[skipped & tainted[slot] & ~reset[applicant_codes]])
+        if not len(newly):
+            break
+        reset[newly] = True
+
+    ptr[reset] = starts[reset]
+    held = _deferred_acceptance(applicant_codes, ends, prog, prog_seats, key,
+                                ptr, holding[(holding >= 0) & ~reset], np.flatnonzero(reset))
+    accepted[pref[held]] = True
+    return accepted
+
+
+def summarize(accepted, program_codes, scores, seats):
+    program_codes = np.asarray(program_codes, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.int64)
+    seats = np.asarray(seats, dtype=np.int64)
+
+    enrolled = np.bincount(program_codes[accepted], minlength=len(seats))[:len(seats)]
+    lowest = np.full(len(seats), np.iinfo(np.int64).max)
+    np.minimum.at(lowest, program_codes[accepted], scores[accepted])
+    passing = np.where((seats > 0) & (enrolled >= seats), lowest, -1)
+    return enrolled, passing
+
+
+def random_campaign(applications, programs=8, max_choices=4, seed=0):
+    rng = np.random.default_rng(seed)
+    choices = rng.integers(1, max_choices + 1, size=applications)
+    choices = choices[:np.searchsorted(np.cumsum(choices), applications) + 1]
+
+    applicant_ids = np.repeat(np.arange(len(choices)), choices)[:applications]
+    priorities = np.concatenate([np.arange(1, c + 1) for c in choices])[:applications]
+    base = np.repeat(rng.integers(0, programs, size=len(choices)), choices)[:applications]
+    program_codes = (base + priorities - 1) % programs
+    scores = rng.integers(150, 311, size=applications)
+    seats = np.full(programs, applications // (programs * 4))
+    return applicant_ids, program_codes, priorities, scores, seats
+
+
+if __name__ == '__main__':
+    for size in (10_000, 100_000, 1_000_000):
+        campaign = random_campaign(size)
+        start = time.perf_counter()
+        accepted = enroll(*campaign)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>9} заявлений: {elapsed * 1000:.1f} мс, зачислено {accepted.sum()}")
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import re
+import shutil
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+COLUMNS = {
+    'ID': 'applicant_id',
+    'Согласие': 'consent',
+    'Приоритет': 'priority',
+    'Физика': 'physics',
+    'Русский': 'russian',
+    'Математика': 'math',
+    'Достижения': 'achievements',
+    'Сумма': 'total',
+    'Программа': 'program',
+}
+
+INT_COLUMNS = ['applicant_id', 'priority', 'physics', 'russian', 'math', 'achievements', 'total']
+
+DEFAULTS = {
+    'consent': False,
+    'priority': 1,
+    'physics': 0,
+    'russian': 0,
+    'math': 0,
+    'achievements': 0,
+    'total': 0,
+    'program': 'ПМ',
+}
+
+DATE_PATTERN = re.compile(r'(\d{2}\.\d{2})')
+
+RECORD_COLUMNS = INT_COLUMNS[:1] + ['consent'] + INT_COLUMNS[1:] + ['program', 'date']
+
+KEY_COLUMNS = ['applicant_id', 'program']
+VALUE_COLUMNS = ['consent', 'priority', 'physics', 'russian', 'math', 'achievements', 'total']
+
+Delta = namedtuple('Delta', ['inserts', 'updates', 'deletes', 'changed_ids'])
+
+
+def empty_frame():
+    return pd.DataFrame({col: pd.Series(dtype=object) for col in RECORD_COLUMNS})
+
+
+def _to_int(series, column):
+    values = pd.to_numeric(series, errors='coerce')
+    bad = values.isna() | (values != values.round())
+    if bad.any():
+        rows = ', '.join(str(i + 2) for i in series.index[bad][:5])
+        raise ValueError(f'Колонка "{column}": некорректные значения в строках {rows}')
+    return values.astype('int64')
+
+
+def _to_consent(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return series == 1
+    return series.astype(str).str.strip() == '1'
+
+
+def prepare_frame(df, date):
+    if 'ID' not in df.columns:
+        return empty_frame()
+
+    df = df.rename(columns=COLUMNS)
+    frame = pd.DataFrame(index=df.index)
+
+    for col in RECORD_COLUMNS:
+        if col == 'date':
+            frame[col] = date
+        elif col not in df.columns:
+            frame[col] = DEFAULTS[col]
+        elif col in INT_COLUMNS:
+            source = next(k for k, v in COLUMNS.items() if v == col)
+            frame[col] = _to_int(df[col], source)
+        elif col == 'consent':
+            frame[col] = _to_consent(df[col])
+        else:
+            frame[col] = df[col].fillna(DEFAULTS[col]).astype(str).str.strip()
+
+    return frame.reset_index(drop=True)
+
+
+def to_records(frame):
+    return frame.to_dict('records')
+
+
+def normalize(frame):
+    frame = frame.copy()
+    for col in INT_COLUMNS:
+        frame[col] = frame[col].fillna(DEFAULTS.get(col, 0)).astype('int64')
+    frame['consent'] = frame['consent'].fillna(False).astype(bool)
+    frame['program'] = frame['program'].astype(str)
+    return frame
+
+
+def row_hashes(frame):
+    return pd.util.hash_pandas_object(frame[VALUE_COLUMNS], index=False).to_numpy()
+
+
+def diff_frames(existing, new):
+    existing = normalize(existing)
+    new = normalize(new).drop_duplicates(KEY_COLUMNS, keep='last')
+
+    duplicates = existing.duplicated(KEY_COLUMNS, keep='first')
+    stale_ids = existing.loc[duplicates, 'id'].tolist()
+    existing = existing[~duplicates]
+
+    old = pd.Series(row_hashes(existing), index=pd.MultiIndex.from_frame(existing[KEY_COLUMNS]))
+    cur = pd.Series(row_hashes(new), index=pd.MultiIndex.from_frame(new[KEY_COLUMNS]))
+
+    inserted = ~cur.index.isin(old.index)
+    deleted = ~old.index.isin(cur.index)
+    common = cur.index[~inserted]
+    changed = cur.loc[common].to_numpy() != old.loc[common].to_numpy()
+
+    inserts = new[inserted]
+    updates = new[~inserted][changed].copy()
+    updates['id'] = existing.set_index(KEY_COLUMNS).loc[common[changed], 'id'].to_numpy()
+    deletes = existing.loc[deleted, 'id'].tolist() + stale_ids
+
+    changed_ids = set(inserts['applicant_id']) | set(updates['applicant_id'])
+    changed_ids |= set(existing.loc[deleted, 'applicant_id'])
+
+    return Delta(inserts, updates, deletes, {int(i) for i in changed_ids})
+
+
+def date_from_name(name):
+    match = DATE_PATTERN.search(name)
+    return match.group(1) if match else None
+
+
+class HashingReader(io.RawIOBase):
+    def __init__(self, stream, spool=None):
+        self.stream = stream
+        self.spool = spool
+        self.hash = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.hash.update(data)
+        if self.spool is not None:
+            self.spool.write(data)
+        return len(data)
+
+    def drain(self, block_size=1 << 16):
+        while self.read(block_size):
+            pass
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+# Один проход по уже принятому Werkzeug файлу (в памяти или во временном файле): без повторного
+# чтения и отдельного сохранения, но таблица собирается целиком - она сравнивается с записями за день
+def read_stream(source, date, chunk_rows=50000, spool=None):
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    raw = HashingReader(source, spool)
+    frames = [prepare_frame(chunk, date)
+              for chunk in pd.read_csv(io.BufferedReader(raw), chunksize=chunk_rows)]
+    raw.drain()
+
+    frame = pd.concat(frames, ignore_index=True) if frames else empty_frame()
+    return frame, raw.hexdigest()
+
+
+def archive_spool(spool, path):
+    try:
+        spool.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(spool, f)
+    finally:
+        spool.close()
+
+
+def iter_archive(stream):
+    with zipfile.ZipFile(stream) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith('.csv'):
+                continue
+            date = date_from_name(info.filename)
+            if not date:
+                raise ValueError(f'Не удалось определить дату для файла {info.filename}')
+            with archive.open(info) as member:
+                yield date, info.filename, member.read()
+
+
+def parse_files(items, workers=4, chunk_rows=50000):
+    def parse(item):
+        date, name, source, spool = item
+        try:
+            return read_stream(source, date, chunk_rows, spool)
+        except ValueError as e:
+            raise ValueError(f'{name}: {e}') from e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse, items))
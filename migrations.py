@@ -0,0 +1,194 @@
+from sqlalchemy import bindparam, inspect, text
+
+
+def normalize_applicant(conn, context):
+    columns = {c['name'] for c in inspect(conn).get_columns('applicant')}
+    if 'program_id' in columns:
+        return
+
+    statements = [
+        'CREATE TABLE IF NOT EXISTS program ('
+        'id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(20) NOT NULL UNIQUE, seats INTEGER)',
+        'CREATE TABLE IF NOT EXISTS campaign_day ('
+        'id INTEGER NOT NULL PRIMARY KEY, day DATE NOT NULL UNIQUE, label VARCHAR(5) NOT NULL UNIQUE)',
+        'CREATE TABLE IF NOT EXISTS person (id INTEGER NOT NULL PRIMARY KEY)',
+        'INSERT OR IGNORE INTO program (name, seats) '
+        'SELECT DISTINCT program, 0 FROM applicant WHERE program IS NOT NULL',
+        "INSERT OR IGNORE INTO campaign_day (day, label) "
+        "SELECT DISTINCT printf('%04d-%s-%s', :year, substr(date, 4, 2), substr(date, 1, 2)), date "
+        "FROM applicant WHERE date IS NOT NULL",
+        'INSERT OR IGNORE INTO person (id) '
+        'SELECT DISTINCT applicant_id FROM applicant WHERE applicant_id IS NOT NULL',
+        'DROP INDEX IF EXISTS ix_applicant_date_program_consent_total',
+        'DROP INDEX IF EXISTS ix_applicant_program_consent_total',
+        'DROP INDEX IF EXISTS ix_applicant_applicant_id_date',
+        'ALTER TABLE applicant RENAME TO applicant_old',
+        'CREATE TABLE applicant ('
+        'id INTEGER NOT NULL PRIMARY KEY, '
+        'applicant_id INTEGER REFERENCES person (id), '
+        'program_id SMALLINT REFERENCES program (id), '
+        'day_id SMALLINT REFERENCES campaign_day (id), '
+        'consent BOOLEAN, priority SMALLINT, physics SMALLINT, russian SMALLINT, '
+        'math SMALLINT, achievements SMALLINT, total SMALLINT)',
+        'INSERT INTO applicant (id, applicant_id, program_id, day_id, consent, priority, '
+        'physics, russian, math, achievements, total) '
+        'SELECT a.id, a.applicant_id, p.id, d.id, a.consent, a.priority, '
+        'a.physics, a.russian, a.math, a.achievements, a.total '
+        'FROM applicant_old a JOIN program p ON p.name = a.program JOIN campaign_day d ON d.label = a.date',
+        'DROP TABLE applicant_old',
+        'CREATE INDEX ix_applicant_day_program_consent_total '
+        'ON applicant (day_id, program_id, consent, total DESC)',
+        'CREATE INDEX ix_applicant_program_consent_total ON applicant (program_id, consent, total DESC)',
+        'CREATE INDEX ix_applicant_applicant_id_day ON applicant (applicant_id, day_id)',
+    ]
+    for statement in statements:
+        conn.execute(text(statement), {'year': context.get('year')})
+
+    for name, seats in context.get('seats', {}).items():
+        conn.execute(text('UPDATE program SET seats = :seats WHERE name = :name'),
+                     {'seats': seats, 'name': name})
+
+
+def create_program_day_stats(conn, context):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS program_day_stats ('
+        'program_id INTEGER NOT NULL REFERENCES program (id), '
+        'day_id INTEGER NOT NULL REFERENCES campaign_day (id), '
+        'total INTEGER, consent INTEGER, min_total INTEGER, max_total INTEGER, avg_total FLOAT, '
+        'PRIMARY KEY (program_id, day_id))'
+    ))
+    conn.execute(text('DELETE FROM program_day_stats'))
+    conn.execute(text(
+        'INSERT INTO program_day_stats '
+        '(program_id, day_id, total, consent, min_total, max_total, avg_total) '
+        'SELECT program_id, day_id, count(*), sum(CASE WHEN consent THEN 1 ELSE 0 END), '
+        'min(total), max(total), avg(total) '
+        'FROM applicant GROUP BY program_id, day_id'
+    ))
+
+
+def add_enrollment_state(conn, context):
+    columns = {c['name'] for c in inspect(conn).get_columns('applicant')}
+    if 'enrolled' not in columns:
+        conn.execute(text('ALTER TABLE applicant ADD COLUMN enrolled BOOLEAN DEFAULT 0'))
+
+    columns = {c['name'] for c in inspect(conn).get_columns('program_day_stats')}
+    if 'enrolled' not in columns:
+        conn.execute(text('ALTER TABLE program_day_stats ADD COLUMN enrolled INTEGER DEFAULT 0'))
+    if 'passing_score' not in columns:
+        conn.execute(text('ALTER TABLE program_day_stats ADD COLUMN passing_score INTEGER'))
+
+
+RANK_UPDATE = (
+    'UPDATE applicant SET list_rank = ranked.list_rank, consent_rank = ranked.consent_rank FROM ('
+    'SELECT id, '
+    'row_number() OVER (PARTITION BY day_id, program_id ORDER BY total DESC, applicant_id) AS list_rank, '
+    'CASE WHEN consent THEN row_number() OVER ('
+    'PARTITION BY day_id, program_id, consent ORDER BY total DESC, applicant_id) END AS consent_rank '
+    'FROM applicant {where}) AS ranked '
+    'WHERE applicant.id = ranked.id'
+)
+
+
+def rank_applications(conn, day_id=None, program_ids=None):
+    if day_id is None:
+        conn.execute(text(RANK_UPDATE.format(where='')))
+        return
+    statement = text(RANK_UPDATE.format(where='WHERE day_id = :day_id AND program_id IN :program_ids'))
+    conn.execute(statement.bindparams(bindparam('program_ids', expanding=True)),
+                 {'day_id': day_id, 'program_ids': list(program_ids)})
+
+
+def add_list_ranks(conn, context):
+    columns = {c['name'] for c in inspect(conn).get_columns('applicant')}
+    for column in ('list_rank', 'consent_rank'):
+        if column not in columns:
+            conn.execute(text(f'ALTER TABLE applicant ADD COLUMN {column} INTEGER'))
+    rank_applications(conn)
+
+
+def add_report_job_stats(conn, context):
+    if 'report_job' not in inspect(conn).get_table_names():
+        return
+    columns = {c['name'] for c in inspect(conn).get_columns('report_job')}
+    for column, kind in (('full_list', 'BOOLEAN DEFAULT 0'), ('pages', 'INTEGER'), ('seconds', 'FLOAT')):
+        if column not in columns:
+            conn.execute(text(f'ALTER TABLE report_job ADD COLUMN {column} {kind}'))
+
+
+MIGRATIONS = [
+    (1, 'Составные индексы для таблицы applicant', [
+        'CREATE INDEX IF NOT EXISTS ix_applicant_date_program_consent_total '
+        'ON applicant (date, program, consent, total DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_program_consent_total '
+        'ON applicant (program, consent, total DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_applicant_id_date '
+        'ON applicant (applicant_id, date)',
+    ]),
+    (2, 'Нормализованная схема: program, campaign_day, person', [normalize_applicant]),
+    (3, 'Агрегаты по программам и датам: program_day_stats', [create_program_day_stats]),
+    (4, 'Сохраненное состояние зачисления', [add_enrollment_state]),
+    (5, 'Места в конкурсных списках', [add_list_ranks]),
+    (6, 'Полные списки и статистика построения отчетов', [add_report_job_stats]),
+    (7, 'Индексы под постраничную выдачу конкурсных списков', [
+        'CREATE INDEX IF NOT EXISTS ix_applicant_total_id ON applicant (total DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_day_program_total_id '
+        'ON applicant (day_id, program_id, total DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_priority_id ON applicant (priority DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_day_program_priority_id '
+        'ON applicant (day_id, program_id, priority DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS ix_applicant_day_program_applicant_id '
+        'ON applicant (day_id, program_id, applicant_id DESC, id DESC)',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+ENROLLMENT_VERSION = 4
+
+
+def current_version(conn):
+    return conn.execute(text('PRAGMA user_version')).scalar()
+
+
+def set_version(conn, version):
+    conn.execute(text(f'PRAGMA user_version = {int(version)}'))
+
+
+def upgrade(engine, metadata, context=None):
+    context = context or {}
+    with engine.begin() as conn:
+        existing = set(inspect(conn).get_table_names())
+
+        if 'applicant' not in existing:
+            metadata.create_all(conn)
+            set_version(conn, LATEST_VERSION)
+            return []
+
+        version = current_version(conn)
+        applied = []
+        for number, description, steps in MIGRATIONS:
+            if number <= version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(conn, context)
+                else:
+                    conn.execute(text(step))
+            set_version(conn, number)
+            applied.append((number, description))
+            print(f"Миграция {number} применена: {description}")
+
+        metadata.create_all(conn)
+        return applied
+
+
+def explain(conn, statement, params=None):
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', params or ()).all()
+    return [row[-1] for row in rows]
+
+
+def uses_index(plan, table):
+    for detail in plan:
+        if detail.startswith(f'SCAN {table}') and 'INDEX' not in detail:
+            return False
+    return True
@@ -1,73 +1,28 @@
 import io
 from datetime import datetime
-from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
-import os
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
 
-
-def register_russian_fonts():
-    font_paths = [
-        'arial.ttf',
-        '/usr/share/fonts/truetype/msttcorefonts/arial.ttf',
-        '/Library/Fonts/Arial.ttf',
-        'DejaVuSans.ttf',
-        '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
-    ]
-
-    for font_path in font_paths:
-        if os.path.exists(font_path):
-            try:
-                pdfmetrics.registerFont(TTFont('RussianFont', font_path))
-                pdfmetrics.registerFont(TTFont('RussianFont-Bold', font_path))
-                return 'RussianFont'
-            except:
-                pass
-
-    return 'Helvetica'
+import report_resources
 
 
 def create_pdf_report(report_type, program='all', date='all', applicants_data=None):
     buffer = io.BytesIO()
 
-    font_name = register_russian_fonts()
+    font = report_resources.fonts()
+    style = report_resources.styles()
 
     doc = SimpleDocTemplate(buffer, pagesize=A4)
     elements = []
 
-    styles = getSampleStyleSheet()
-
-    if font_name != 'Helvetica':
-        title_style = ParagraphStyle(
-            'RussianTitle',
-            fontName=f'{font_name}-Bold',
-            fontSize=16,
-            alignment=1,
-            spaceAfter=30
-        )
-
-        normal_style = ParagraphStyle(
-            'RussianNormal',
-            fontName=font_name,
-            fontSize=10
-        )
-    else:
-        title_style = styles['Heading1']
-        normal_style = styles['Normal']
-
     if report_type == 'summary':
-        title = "Summary Report" if font_name == 'Helvetica' else "Сводный отчет"
+        title = "Summary Report" if not font.cyrillic else "Сводный отчет"
     elif report_type == 'detailed':
-        title = "Detailed List" if font_name == 'Helvetica' else "Детальный список"
+        title = "Detailed List" if not font.cyrillic else "Детальный список"
     else:
-        title = "Competition Lists" if font_name == 'Helvetica' else "Конкурсные списки"
+        title = "Competition Lists" if not font.cyrillic else "Конкурсные списки"
 
-    elements.append(Paragraph(title, title_style))
+    elements.append(Paragraph(title, style.title))
     if applicants_data:
         table_data = [['ID', 'Score', 'Consent']]
         for app in applicants_data:
@@ -78,21 +33,12 @@ def create_pdf_report(report_type, program='all', date='all', applicants_data=No
             ])
 
         table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        table.setStyle(style.table)
 
         elements.append(table)
 
     elements.append(Spacer(1, 20))
-    elements.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", normal_style))
+    elements.append(Paragraph(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}", style.normal))
 
     doc.build(elements)
     buffer.seek(0)
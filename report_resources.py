@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import namedtuple
+
+from reportlab.lib import colors
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import TableStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+FONT_NAME = 'RussianFont'
+BOLD_FONT_NAME = 'RussianFont-Bold'
+
+FONT_PATHS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'arial.ttf'),
+    '/usr/share/fonts/truetype/msttcorefonts/arial.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+]
+
+Fonts = namedtuple('Fonts', 'regular bold cyrillic')
+Styles = namedtuple('Styles', 'title normal table')
+
+_fonts = None
+_styles = None
+_lock = threading.Lock()
+
+
+def _register_fonts():
+    for path in FONT_PATHS:
+        if not os.path.exists(path):
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+            pdfmetrics.registerFont(TTFont(BOLD_FONT_NAME, path))
+        except Exception as e:
+            print(f"Не удалось загрузить шрифт {path}: {e}")
+            continue
+        print(f"Русский шрифт зарегистрирован: {path}")
+        return Fonts(FONT_NAME, BOLD_FONT_NAME, True)
+
+    print("Русский шрифт не найден, используется Helvetica")
+    return Fonts('Helvetica', 'Helvetica-Bold', False)
+
+
+# Шрифт разбирается один раз на процесс, дальше отчеты берут готовые имена
+def fonts():
+    global _fonts
+    with _lock:
+        if _fonts is None:
+            _fonts = _register_fonts()
+        return _fonts
+
+
+def styles():
+    global _styles
+    font = fonts()
+    with _lock:
+        if _styles is None:
+            sample = getSampleStyleSheet()
+            if font.cyrillic:
+                title = ParagraphStyle('RussianTitle', fontName=font.bold, fontSize=16,
+                                       alignment=1, spaceAfter=30)
+                normal = ParagraphStyle('RussianNormal', fontName=font.regular, fontSize=10)
+            else:
+                title = sample['Heading1']
+                normal = sample['Normal']
+
+            table = TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), font.bold),
+                ('FONTNAME', (0, 1), (-1, -1), font.regular),
+                ('FONTSIZE', (0, 0), (-1, 0), 14),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ])
+            _styles = Styles(title, normal, table)
+        return _styles
@@ -0,0 +1,88 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import enrollment
+
+
+def transition_rates(program_codes, before, after, programs, horizon=1):
+    program_codes = np.asarray(program_codes, dtype=np.int64)
+    before = np.asarray(before, dtype=bool)
+    after = np.asarray(after, dtype=bool)
+
+    # Доля заявлений без согласия, получивших его к следующей дате, и доля отозванных согласий
+    waiting = np.bincount(program_codes[~before], minlength=programs)[:programs]
+    gained = np.bincount(program_codes[~before & after], minlength=programs)[:programs]
+    holding = np.bincount(program_codes[before], minlength=programs)[:programs]
+    lost = np.bincount(program_codes[before & ~after], minlength=programs)[:programs]
+
+    gain = np.divide(gained, waiting, out=np.zeros(programs), where=waiting > 0)
+    loss = np.divide(lost, holding, out=np.zeros(programs), where=holding > 0)
+    return 1 - (1 - gain) ** horizon, 1 - (1 - loss) ** horizon
+
+
+def consent_share(program_codes, consent, programs):
+    program_codes = np.asarray(program_codes, dtype=np.int64)
+    total = np.bincount(program_codes, minlength=programs)[:programs]
+    agreed = np.bincount(program_codes[np.asarray(consent, dtype=bool)], minlength=programs)[:programs]
+    return np.divide(agreed, total, out=np.zeros(programs), where=total > 0)
+
+
+def _run_batch(args):
+    applicant_ids, program_codes, priorities, scores, seats, consent, gain, loss, trials, seed = args
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(len(applicant_ids), dtype=np.int64)
+
+    for _ in range(trials):
+        draw = rng.random(len(applicant_ids))
+        consenting = np.flatnonzero(np.where(consent, draw >= loss[program_codes], draw < gain[program_codes]))
+        accepted = enrollment.enroll(applicant_ids[consenting], program_codes[consenting],
+                                     priorities[consenting], scores[consenting], seats)
+        counts[consenting[accepted]] += 1
+
+    return counts
+
+
+# Каждая попытка: разыгрываем согласия по историческим долям, затем полный каскад
+# зачисления; вероятность - доля попыток, в которых заявление прошло.
+def simulate(applicant_ids, program_codes, priorities, scores, seats, consent, gain, loss,
+             trials=1000, workers=1, seed=0):
+    applicant_ids = np.asarray(applicant_ids, dtype=np.int64)
+    program_codes = np.asarray(program_codes, dtype=np.int64)
+    priorities = np.asarray(priorities, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.int64)
+    seats = np.asarray(seats, dtype=np.int64)
+    consent = np.asarray(consent, dtype=bool)
+
+    programs = max(len(seats), int(program_codes.max()) + 1 if len(program_codes) else 0)
+    gain = np.resize(np.asarray(gain, dtype=float), programs)
+    loss = np.resize(np.asarray(loss, dtype=float), programs)
+
+    workers = max(1, min(workers, trials))
+    sizes = [trials // workers + (i < trials % workers) for i in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    batches = [(applicant_ids, program_codes, priorities, scores, seats, consent, gain, loss, size, s)
+               for size, s in zip(sizes, seeds)]
+
+    if workers == 1:
+        counts = _run_batch(batches[0])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = sum(executor.map(_run_batch, batches))
+
+    return counts / trials if trials else counts.astype(float)
+
+
+if __name__ == '__main__':
+    applicant_ids, program_codes, priorities, scores, seats = enrollment.random_campaign(20_000)
+    consent = np.random.default_rng(1).random(len(applicant_ids)) < 0.4
+    for workers in (1, os.cpu_count() or 1):
+        start = time.perf_counter()
+        probability = simulate(applicant_ids, program_codes, priorities, scores, seats, consent,
+                               np.full(len(seats), 0.2), np.full(len(seats), 0.05),
+                               trials=200, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers} процесс(ов): 200 попыток за {elapsed:.2f} с, "
+              f"средняя вероятность {probability.mean():.3f}")
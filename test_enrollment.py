@@ -0,0 +1,69 @@
+import numpy as np
+
+import enrollment
+
+
+def random_rows(rng, applicants, programs):
+    rows = {}
+    for applicant in applicants:
+        choices = rng.permutation(programs)[:rng.integers(1, programs + 1)]
+        for priority, program in enumerate(choices, 1):
+            rows[(applicant, int(program))] = (priority, int(rng.integers(5, 12)))
+    return rows
+
+
+def columns(rows):
+    keys = sorted(rows)
+    return (np.array([a for a, _ in keys]), np.array([p for _, p in keys]),
+            np.array([rows[k][0] for k in keys]), np.array([rows[k][1] for k in keys]), keys)
+
+
+def change(rng, rows, programs):
+    new = dict(rows)
+    applicants = sorted({a for a, _ in rows})
+    for key in list(new):
+        action = rng.random()
+        if action < 0.1:
+            del new[key]
+        elif action < 0.2:
+            new[key] = (new[key][0], int(rng.integers(5, 12)))
+        elif action < 0.25:
+            new[key] = (int(rng.integers(1, programs + 1)), new[key][1])
+    new.update(random_rows(rng, range(len(applicants), len(applicants) + rng.integers(0, 3)), programs))
+
+    differ = (set(rows) ^ set(new)) | {key for key in rows if key in new and new[key] != rows[key]}
+    changed = {applicant for applicant, _ in differ}
+    touched = {program for _, program in differ}
+    return new, changed, touched
+
+
+def test_reenroll_matches_enroll():
+    rng = np.random.default_rng(0)
+    for _ in range(3000):
+        programs = int(rng.integers(1, 4))
+        seats = rng.integers(0, 3, size=programs)
+        rows = random_rows(rng, range(rng.integers(1, 8)), programs)
+        *old, old_keys = columns(rows)
+        before = dict(zip(old_keys, enrollment.enroll(*old, seats)))
+
+        new, changed, touched = change(rng, rows, programs)
+        if not new:
+            continue
+        *data, keys = columns(new)
+        previous = [before.get(key, False) for key in keys]
+
+        expected = enrollment.enroll(*data, seats)
+        actual = enrollment.reenroll(*data, seats, previous, changed, touched)
+        assert (actual == expected).all(), (rows, new, changed)
+
+
+def test_reenroll_after_withdrawal_of_rejected_applicant():
+    # 0: P0 (9), P1 (18); 1: P1 (13); 2: P1 (13), P0 (16); по одному месту
+    seats = np.array([1, 1])
+    old = ([0, 0, 1, 2, 2], [0, 1, 1, 1, 0], [1, 2, 1, 1, 2], [9, 18, 13, 13, 16])
+    assert enrollment.enroll(*old, seats).tolist() == [False, True, False, False, True]
+
+    new = ([0, 0, 2, 2], [0, 1, 1, 0], [1, 2, 1, 2], [9, 18, 13, 16])
+    previous = [False, True, False, True]
+    accepted = enrollment.reenroll(*new, seats, previous, {1}, {1})
+    assert accepted.tolist() == enrollment.enroll(*new, seats).tolist() == [True, False, True, False]
@@ -1,6 +1,5 @@
 import requests
 import os
-import time
 
 BASE_URL = "http://localhost:5000"
 USERNAME = "admin"
@@ -42,36 +41,45 @@ def login(session):
     response = session.post(login_url, data=data, allow_redirects=True)
     return response.status_code == 200
 
-cleared_dates = set()
 
-def upload_file(session, date, filename):
-    filepath = os.path.join(UPLOAD_DIR, filename)
+def upload_batch(session, files_to_upload):
+    dates = []
+    files = []
+    handles = []
 
-    if not os.path.exists(filepath):
-        print(f"Файл не найден: {filepath}")
-        return False
+    try:
+        for date, filename in files_to_upload:
+            filepath = os.path.join(UPLOAD_DIR, filename)
+
+            if not os.path.exists(filepath):
+                print(f"Файл не найден: {filepath}")
+                continue
 
-    data = {"date": date}
+            f = open(filepath, "rb")
+            handles.append(f)
+            files.append(("csv_files", (filename, f, "text/csv")))
+            dates.append(date)
 
-    if date in cleared_dates:
-        data["skip_clear"] = "1"
+        if not files:
+            return 0
 
-    with open(filepath, "rb") as f:
-        files = {"csv_file": (filename, f, "text/csv")}
         response = session.post(
-            f"{BASE_URL}/upload",
+            f"{BASE_URL}/upload_batch",
             files=files,
-            data=data,
+            data={"dates": dates},
             allow_redirects=True
         )
+    finally:
+        for f in handles:
+            f.close()
 
-    if response.status_code == 200:
-        print(f"Загружено: {filename}")
-        cleared_dates.add(date)
-        return True
+    if response.status_code == 200 and "Ошибка" not in response.text:
+        for _, (filename, _, _) in files:
+            print(f"Загружено: {filename}")
+        return len(files)
 
-    print(f"Ошибка загрузки: {filename}")
-    return False
+    print("Ошибка пакетной загрузки")
+    return 0
 
 def main():
     try:
@@ -86,11 +94,7 @@ def main():
         print("Не удалось войти")
         return
 
-    success = 0
-    for date, filename in FILES_TO_UPLOAD:
-        if upload_file(session, date, filename):
-            success += 1
-        time.sleep(0.1)
+    success = upload_batch(session, FILES_TO_UPLOAD)
 
     print(f"\nИтого загружено: {success} / {len(FILES_TO_UPLOAD)}")
 